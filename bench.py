@@ -0,0 +1,333 @@
+import http.client
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from http.server import ThreadingHTTPServer
+
+import overlay
+from fakeretro import FakeRetro, load_timeline
+from gamestate import COMMIT, GameEngine
+from memclient import MemClient
+from memmap import FIELDS, MEMMAP, MODE1_PITCH, MODE2_PITCH, STATE_VIEW, WRAM_BASE
+from wramcap import CAP_READS, dump_wram, vote
+
+# 読み取り → 確定 → 配信の速さを、fakeretro.py のローカルサーバ相手に測って JSON に残す。
+#
+#   python bench.py                 # 全部（30秒くらい）
+#   python bench.py quick           # 短め
+#   python bench.py reads http      # 一部だけ（reads / commit / wram / http）
+#
+# 結果は BENCH_DIR/YYYYmmdd_HHMMSS.json。前回の結果があれば並べて表示する。
+
+BENCH_DIR = "bench"
+SOURCES = ("score_snaps", "old/snaps")
+
+LATENCY_SEC = 0.0002   # fakeretro の返事の遅延（ローカルの RetroArch くらい）
+READ_SEC = 1.0         # 読み取り速度を測る時間（1種類あたり）
+PITCHES = 20           # 立ち上がり → state の遅延を測る投球数（1方式あたり）
+F_SEC = 0.4            # 1球ごとの F の長さ
+P_SEC = 0.2            # 1球ごとの P の長さ
+WRAM_ROUNDS = 20
+HTTP_THREADS = 4
+HTTP_REQUESTS = 500    # 1スレッドあたり
+
+
+def pct(xs):
+    """ミリ秒の分布（p50 / p90 / p99 / max）。"""
+    if not xs:
+        return None
+    xs = sorted(xs)
+    def at(q):
+        return round(xs[min(len(xs) - 1, int(q * len(xs)))] * 1000, 3)
+    return {"n": len(xs), "p50": at(0.50), "p90": at(0.90), "p99": at(0.99), "max": round(xs[-1] * 1000, 3)}
+
+
+def _base():
+    return load_timeline(SOURCES)[0][1]
+
+
+def _server(timeline, **kw):
+    return FakeRetro(timeline, port=0, latency=LATENCY_SEC, seed=1, **kw).start()
+
+
+class _Handler(overlay.Handler):
+    def log_message(self, *args):
+        # アクセスログは測定の邪魔なので出さない
+        pass
+
+
+def _rate(fn, sec):
+    n = 0
+    t0 = time.perf_counter()
+    while time.perf_counter() - t0 < sec:
+        fn()
+        n += 1
+    return n / (time.perf_counter() - t0)
+
+
+# ====== 各ベンチ ======
+
+def bench_reads(quick=False):
+    """1バイトずつ / まとめて / ブロックの読み取り速度（回/秒）。"""
+    sec = READ_SEC / 4 if quick else READ_SEC
+    srv = _server([(0.0, _base())])
+    c = MemClient(*srv.addr)
+    addrs = [f.addr for f in FIELDS]
+    coherent = MEMMAP.view(*STATE_VIEW.names, "home", "away", gap=0x2000, max_len=0x2000, gated=False)
+    out = {
+        "u8_per_sec": _rate(lambda: c.read_u8(addrs[0]), sec),
+        "u8_many_per_sec": _rate(lambda: c.read_u8_many(addrs), sec),
+        "state_plan_per_sec": _rate(lambda: STATE_VIEW.read(c), sec),
+        "coherent_block_per_sec": _rate(lambda: coherent.read(c), sec),
+        "fields": len(addrs),
+        "state_plan_blocks": len(STATE_VIEW.plan.blocks),
+        "coherent_block_bytes": coherent.plan.blocks[0][1],
+    }
+    out["fields_per_sec_u8"] = out["u8_per_sec"]
+    out["fields_per_sec_u8_many"] = out["u8_many_per_sec"] * len(addrs)
+    srv.stop()
+    return {k: round(v, 1) if isinstance(v, float) else v for k, v in out.items()}
+
+
+def _pitch_timeline(base, pitches):
+    # F と P を交互に。k 球目の P では HOME スコアに k を入れて、どの球の値か分かるようにする
+    def frame(mode1, mode2, k):
+        w = bytearray(base)
+        w[MEMMAP.addr("mode1") - WRAM_BASE] = mode1
+        w[MEMMAP.addr("mode2") - WRAM_BASE] = mode2
+        w[MEMMAP.addr("home") - WRAM_BASE] = k
+        return bytes(w)
+    tl = []
+    edges = []
+    t = 0.0
+    for k in range(1, pitches + 1):
+        tl.append((t, frame(0x01, 0x1A, k - 1)))
+        t += F_SEC
+        tl.append((t, frame(MODE1_PITCH, MODE2_PITCH, k)))
+        edges.append(t)
+        t += P_SEC
+    return tl, edges
+
+
+def _edge_to_state(coherent, pitches):
+    """F->P から /events に新しい値が届くまで（overlay.py と同じ組み立てをこのプロセスで回す）。"""
+    tl, edges = _pitch_timeline(_base(), pitches)
+    # 前の回の値が /events の最初の1フレームで k 球目と見間違えられないように
+    overlay.BOARD.update(home=0)
+    srv = _server(tl)
+    engine = GameEngine(MemClient(*srv.addr), coherent=coherent)
+    engine.subscribe(overlay.BOARD.on_commit, [COMMIT])
+    commit_at = {}
+    engine.subscribe(lambda ev: commit_at.setdefault(ev.state["home_raw"], time.monotonic()), [COMMIT])
+    overlay.ENGINE = engine
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+
+    seen_at = {}
+
+    def listen():
+        conn = http.client.HTTPConnection(*httpd.server_address, timeout=5)
+        conn.request("GET", "/events")
+        r = conn.getresponse()
+        try:
+            for line in r:
+                if line.startswith(b"data: "):
+                    seen_at.setdefault(json.loads(line[6:])["home"], time.monotonic())
+        except OSError:
+            pass
+
+    threading.Thread(target=listen, daemon=True).start()
+    stop = threading.Event()
+
+    def loop():
+        while not stop.is_set():
+            wait = engine.step()
+            overlay.BOARD.set_gate(engine.gate["mode1"], engine.gate["mode2"])
+            stop.wait(wait)
+
+    # fakeretro の時計（t0）とそろえて始める
+    srv.t0 = time.monotonic()
+    th = threading.Thread(target=loop, daemon=True)
+    th.start()
+    time.sleep(tl[-1][0] + P_SEC + 0.2)
+    stop.set()
+    th.join()
+    httpd.shutdown()
+    srv.stop()
+
+    to_commit, to_state = [], []
+    for k, t in enumerate(edges, 1):
+        edge = srv.t0 + t
+        if k in commit_at:
+            to_commit.append(commit_at[k] - edge)
+        if k in seen_at:
+            to_state.append(seen_at[k] - edge)
+    return {
+        "edges": len(edges),
+        "missed": len(edges) - len(to_state),
+        "edge_to_commit_ms": pct(to_commit),
+        "edge_to_events_ms": pct(to_state),
+        "last_read": engine.last_read,
+        "poll": engine.scheduler.stats() if engine.scheduler else None,
+    }
+
+
+def bench_commit(quick=False):
+    """立ち上がり → 確定 → /events の遅延。coherent（1要求）と settle（K回一致）の両方。"""
+    n = max(4, PITCHES // 4) if quick else PITCHES
+    return {"coherent": _edge_to_state(True, n), "settle": _edge_to_state(False, n)}
+
+
+def bench_wram(quick=False):
+    """WRAM 全体のダンプと、CAP_READS 回分の多数決にかかる時間。"""
+    srv = _server(load_timeline(SOURCES, hold=0.05))
+    c = MemClient(*srv.addr)
+    rounds = WRAM_ROUNDS // 4 if quick else WRAM_ROUNDS
+    dumps, votes = [], []
+    for _ in range(rounds):
+        matrix = bytearray()
+        for _ in range(CAP_READS):
+            t0 = time.perf_counter()
+            matrix += dump_wram(c)
+            dumps.append(time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        vote(bytes(matrix), CAP_READS, len(matrix) // CAP_READS)
+        votes.append(time.perf_counter() - t0)
+    srv.stop()
+    return {"dump_ms": pct(dumps), "vote_ms": pct(votes), "cap_reads": CAP_READS}
+
+
+def _hammer(addr, headers, threads, per_thread):
+    lat = []
+    lock = threading.Lock()
+
+    def worker():
+        mine = []
+        for _ in range(per_thread):
+            t0 = time.perf_counter()
+            conn = http.client.HTTPConnection(*addr, timeout=5)
+            conn.request("GET", "/state.json", headers=headers)
+            r = conn.getresponse()
+            r.read()
+            conn.close()
+            mine.append(time.perf_counter() - t0)
+        with lock:
+            lat.extend(mine)
+
+    t0 = time.perf_counter()
+    ths = [threading.Thread(target=worker) for _ in range(threads)]
+    for th in ths:
+        th.start()
+    for th in ths:
+        th.join()
+    return {"requests_per_sec": round(len(lat) / (time.perf_counter() - t0), 1), "latency_ms": pct(lat)}
+
+
+def bench_http(quick=False):
+    """/state.json の処理速度（200 と、If-None-Match 一致の 304）。"""
+    per = HTTP_REQUESTS // 5 if quick else HTTP_REQUESTS
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    out = {
+        "threads": HTTP_THREADS,
+        "full": _hammer(httpd.server_address, {}, HTTP_THREADS, per),
+        "not_modified": _hammer(httpd.server_address, {"If-None-Match": overlay.BOARD.etag}, HTTP_THREADS, per),
+    }
+    httpd.shutdown()
+    return out
+
+
+BENCHES = {
+    "reads": bench_reads,
+    "commit": bench_commit,
+    "wram": bench_wram,
+    "http": bench_http,
+}
+
+
+# ====== 結果 ======
+
+def _version():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True,
+                              text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def _flat(d, prefix=""):
+    # {"a": {"b": 1}} -> {"a.b": 1}（数値だけ）
+    out = {}
+    for k, v in d.items():
+        key = f"{prefix}{k}"
+        if isinstance(v, dict):
+            out.update(_flat(v, key + "."))
+        elif isinstance(v, (int, float)) and not isinstance(v, bool):
+            out[key] = v
+    return out
+
+
+def previous(bench_dir=BENCH_DIR, exclude=None):
+    names = sorted(n for n in os.listdir(bench_dir) if n.endswith(".json")) if os.path.isdir(bench_dir) else []
+    names = [os.path.join(bench_dir, n) for n in names]
+    names = [p for p in names if p != exclude]
+    return names[-1] if names else None
+
+
+def _is_metric(key):
+    # 比べる値（件数や設定値は並べない）
+    last = key.rsplit(".", 1)[-1]
+    return last in ("p50", "p99", "missed") or last.endswith("per_sec")
+
+
+def compare(old, new):
+    """2つの結果の、両方にある測定値を [(名前, 前, 今)] で。"""
+    a, b = _flat(old["results"]), _flat(new["results"])
+    return [(k, a[k], b[k]) for k in b if k in a and _is_metric(k)]
+
+
+def main(argv):
+    args = argv[1:]
+    quick = "quick" in args
+    names = [a for a in args if a in BENCHES] or list(BENCHES)
+
+    overlay.EVENTS_ADDR = None
+    overlay.EVENT_LOG_DIR = None
+    result = {
+        "version": _version(),
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "quick": quick,
+        "results": {},
+    }
+    for name in names:
+        t0 = time.perf_counter()
+        print(f"{name}...", flush=True)
+        result["results"][name] = BENCHES[name](quick)
+        print(f"  {json.dumps(result['results'][name], ensure_ascii=False)}  ({time.perf_counter() - t0:.1f}s)")
+
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    path = os.path.join(BENCH_DIR, datetime.now().strftime("%Y%m%d_%H%M%S") + ".json")
+    prev = previous(exclude=path)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=1)
+    print(f"wrote {path}")
+
+    if prev:
+        with open(prev, encoding="utf-8") as f:
+            old = json.load(f)
+        print(f"\nvs {prev} ({old.get('version')}):")
+        for k, a, b in compare(old, result):
+            ratio = f"{b / a:6.2f}x" if a else "     -"
+            print(f"  {k:50} {a:>12} -> {b:>12}  {ratio}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,207 @@
+import json
+import struct
+import threading
+import time
+
+# 1試合分の配信用の状態。overlay.py（1試合）と collector.py（複数試合）の HTTP が読む。
+#
+# 状態は作り終えた Snapshot を board.current に差し替えるだけで公開する（読み手はロックを取らない）。
+# 配信用の JSON もこのときに1回だけ作っておく（リクエストごとに dumps しない）。
+# /events の待ち手は、見ていた Snapshot の superseded が立つのを待つ。
+#
+# 頻繁に読むクライアント向けに、小さい形も2つ持つ:
+#   compact … 固定長のバイナリ（COMPACT。名前やゲートの値は入れない）
+#   delta   … 「版 since からあとで変わった項目だけ」の JSON（直近 DELTA_HISTORY 版ぶん覚えておく）
+#
+# ゲートの生の値（mode1_hex / mode2_hex）は毎ポーリング変わりうるので状態には入れず、
+# 版を上げない別口（gate_body。/gate.json）で配る。
+
+BOOT_ID = f"{int(time.time()):x}"   # 再起動後に古い ETag と一致しないように
+DELTA_HISTORY = 256
+
+# version, home, away, inning, side(0=表 1=裏), balls, strikes, outs, bases(1塁=1 2塁=2 3塁=4), flags(1=consistent)
+COMPACT = struct.Struct("<IBBBBBBBBB")
+
+
+def initial_state(home_name="HOME", away_name="AWAY"):
+    return {
+        "home_name": home_name,
+        "away_name": away_name,
+        "home": 0,
+        "away": 0,
+        "inning": 1,
+        "side": "表",
+        "balls": 0,
+        "strikes": 0,
+        "outs": 0,
+        "on1": False,
+        "on2": False,
+        "on3": False,
+        "updated_at": None,
+        "frame": None,
+        "consistent": None,
+    }
+
+
+def _gate_body(m1_hex, m2_hex):
+    return json.dumps({"mode1_hex": m1_hex, "mode2_hex": m2_hex, "at": time.time()}).encode("utf-8")
+
+
+class Snapshot:
+    """
+    ある版の状態と、その配信用の形。作ったあとは書き換えない（state も読むだけ）。
+    history は直近の [(version, 変わった項目名)]（delta 用）。
+    """
+
+    __slots__ = ("version", "tag", "etag", "state", "body", "compact", "history", "superseded", "_deltas")
+
+    def __init__(self, version, tag, state, history):
+        self.version = version
+        self.tag = tag
+        self.etag = f'"{tag}"'
+        self.state = state
+        self.history = history
+        self.body = json.dumps(state, ensure_ascii=False).encode("utf-8")
+        self.compact = COMPACT.pack(
+            version & 0xFFFFFFFF, state["home"] & 0xFF, state["away"] & 0xFF, state["inning"] & 0xFF,
+            1 if state["side"] == "裏" else 0, state["balls"], state["strikes"], state["outs"],
+            (1 if state["on1"] else 0) | (2 if state["on2"] else 0) | (4 if state["on3"] else 0),
+            1 if state["consistent"] else 0)
+        self.superseded = threading.Event()   # 次の版が出たら立つ
+        self._deltas = {}   # since -> 差分 JSON（同じ版から来るクライアントが多いので使い回す）
+
+    def __repr__(self):
+        return f"<Snapshot {self.tag}>"
+
+
+class Board:
+    """
+    board = Board("HOME", "AWAY", tag="a")
+    engine.subscribe(board.on_commit, [COMMIT])
+    snap = board.current     # いつ読んでもよい（ロックなし）
+
+    書き込み（on_commit / set_gate / update）は更新スレッドから。
+    書き手どうしだけ _write_lock で順番にする（読み手は待たせない・待たない）。
+    """
+
+    def __init__(self, home_name="HOME", away_name="AWAY", tag=""):
+        self.home_name = home_name
+        self.away_name = away_name
+        # 版の名前（ETag の中身、delta の since）は BOOT_ID と tag（試合ごとの名前）と version から作る
+        self.tag_prefix = f"{BOOT_ID}-{tag}-" if tag else f"{BOOT_ID}-"
+        self._write_lock = threading.Lock()
+        self.current = Snapshot(0, self.tag_prefix + "0", initial_state(home_name, away_name), ())
+        self.gate = ("--", "--")
+        self.gate_body = _gate_body(*self.gate)
+
+    def __repr__(self):
+        st = self.current.state
+        return f"<Board v{self.current.version} {st['away']}-{st['home']}>"
+
+    # よく使う値（どれも current を1回読むだけ）
+    @property
+    def version(self):
+        return self.current.version
+
+    @property
+    def etag(self):
+        return self.current.etag
+
+    @property
+    def state(self):
+        return self.current.state
+
+    def publish(self, **values):
+        """今の状態に values を重ねた次の版を作って差し替える。何も変わらなければ何もしない。"""
+        with self._write_lock:
+            old = self.current
+            changed = tuple(k for k, v in values.items() if k not in old.state or old.state[k] != v)
+            if not changed:
+                return old
+            state = dict(old.state)
+            state.update(values)
+            version = old.version + 1
+            history = old.history[-(DELTA_HISTORY - 1):] + ((version, changed),)
+            new = Snapshot(version, f"{self.tag_prefix}{version}", state, history)
+            self.current = new
+        old.superseded.set()
+        return new
+
+    def update(self, **values):
+        """任意の項目を書き換えて配る（テストやリセット用）。"""
+        return self.publish(**values)
+
+    def on_commit(self, ev):
+        st = ev.state
+        self.publish(
+            home_name=self.home_name,
+            away_name=self.away_name,
+            home=int(st["home"]),
+            away=int(st["away"]),
+            inning=int(st["inning"]),
+            side=st["side"],
+            balls=int(st["balls"]),
+            strikes=int(st["strikes"]),
+            outs=int(st["outs"]),
+            on1=bool(st["on1"]),
+            on2=bool(st["on2"]),
+            on3=bool(st["on3"]),
+            updated_at=st["updated_at"],
+            frame=st["frame"],
+            consistent=st["consistent"],
+        )
+
+    def set_gate(self, m1, m2):
+        # 状態の版は上げない。変わったときだけ /gate.json 用の JSON を作り直す
+        gate = (f"{m1:02X}" if m1 is not None else "--", f"{m2:02X}" if m2 is not None else "--")
+        if gate != self.gate:
+            self.gate_body = _gate_body(*gate)
+            self.gate = gate
+
+    def snapshot(self):
+        """(作り置きの JSON, ETag, version)。"""
+        snap = self.current
+        return snap.body, snap.etag, snap.version
+
+    def compact_snapshot(self):
+        """(COMPACT のバイナリ, ETag, version)。"""
+        snap = self.current
+        return snap.compact, snap.etag, snap.version
+
+    def delta(self, since):
+        """
+        版 since（Snapshot.tag の値）からの差分。戻り値は (JSON, 今の tag)。since が今の版なら JSON は None。
+        JSON は {"v": tag, "d": {変わった項目: 値}}。since が古すぎる/別の起動のものなら {"v": tag, "full": state}。
+        """
+        snap = self.current
+        if since == snap.tag:
+            return None, snap.tag
+        body = snap._deltas.get(since)
+        if body is not None:
+            return body, snap.tag
+        n = None
+        if since and since.startswith(self.tag_prefix) and since[len(self.tag_prefix):].isdigit():
+            n = int(since[len(self.tag_prefix):])
+        oldest = snap.history[0][0] if snap.history else snap.version + 1
+        if n is None or n > snap.version or n < oldest - 1:
+            payload = {"v": snap.tag, "full": snap.state}
+        else:
+            keys = set()
+            for v, changed in snap.history:
+                if v > n:
+                    keys.update(changed)
+            payload = {"v": snap.tag, "d": {k: v for k, v in snap.state.items() if k in keys}}
+        body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        if n is not None and len(snap._deltas) < DELTA_HISTORY:
+            snap._deltas[since] = body
+        return body, snap.tag
+
+    def wait(self, version, timeout):
+        """version から変わるまで最長 timeout 秒待つ。戻り値は (version, JSON)。変わらなければ (version, None)。"""
+        snap = self.current
+        if snap.version == version:
+            snap.superseded.wait(timeout)
+            snap = self.current
+        if snap.version != version:
+            return snap.version, snap.body
+        return version, None
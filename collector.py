@@ -0,0 +1,222 @@
+import heapq
+import json
+import os
+import re
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+import eventlog
+import health
+from board import BOOT_ID, Board
+from gamestate import COMMIT, GameEngine
+from memclient import MemClient
+from overlay import Handler
+
+# 複数の RetroArch（ポート違い）を1プロセスで見て、試合ごとの state を配る。
+#
+#   python collector.py                  # collector.json を読む
+#   python collector.py tournament.json
+#
+# collector.json の例:
+#   {
+#     "http": ["127.0.0.1", 8000],
+#     "games": [
+#       {"id": "a", "port": 55355, "home_name": "TIGERS", "away_name": "GIANTS"},
+#       {"id": "b", "port": 55356}
+#     ]
+#   }
+#
+# ポーリングは1本のスレッドで、各試合の「次に読む時刻」の早い順に回す
+# （試合ごとのスレッドは持たない。F の間は pollsched で間隔が延びるので、試合が増えても読む回数はあまり増えない）。
+# 1試合の読み取りが詰まると他の試合も待つので、エミュごとの締め切りは CLIENT_TIMEOUT_SEC と短めにする。
+#
+#   /games.json                 全試合の state をまとめたもの（{id: state.json と同じ中身}）
+#   /games/<id>/state.json      1試合分（ETag / 304 / ?since= は overlay.py と同じ）
+#   /games/<id>/state.bin       1試合分の固定長バイナリ（board.COMPACT）
+#   /games/<id>/events          1試合分の Server-Sent Events
+#   /games/<id>/overlay.html    1試合分のオーバーレイ（OBS にはこれを指定）
+#   /games/<id>/gate.json       ゲートの生の値（デバッグ用。版とは別）
+#   /games/<id>/poll.json
+#   /games/<id>/health          1試合分の /health（下の /health と同じ形）
+#   /health                     全試合の {"status", "games": {id: ...}}。どれか down なら 503
+#   /metrics                    Prometheus のテキスト形式（試合ごとに game ラベル）
+
+CONFIG_PATH = "collector.json"
+HTTP_HOST, HTTP_PORT = "127.0.0.1", 8000
+DEFAULT_HOST = "127.0.0.1"
+
+CLIENT_TIMEOUT_SEC = 0.1   # 1回の読み取りの締め切り（overlay.py の単独運用より短く）
+CLIENT_RETRY_SEC = 0.03
+EVENT_LOG_DIR = eventlog.LOG_DIR   # 試合ごとに <dir>/<id>/ に残す。None なら残さない
+
+GAME_ID = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+class Game:
+    """1台のエミュとその配信用の状態。"""
+
+    def __init__(self, gid, host=DEFAULT_HOST, port=55355, home_name="HOME", away_name="AWAY",
+                 log_dir=EVENT_LOG_DIR):
+        if not GAME_ID.match(gid):
+            raise ValueError(f"game id must be [A-Za-z0-9_-]: {gid!r}")
+        self.id = gid
+        self.board = Board(home_name, away_name, tag=gid)
+        client = MemClient(host, port, timeout=CLIENT_TIMEOUT_SEC, retry_sec=CLIENT_RETRY_SEC)
+        self.engine = GameEngine(client)
+        self.engine.subscribe(self.board.on_commit, [COMMIT])
+        self.updater = health.UpdaterStatus()
+        if log_dir:
+            eventlog.EventLog(os.path.join(log_dir, gid)).attach(self.engine)
+
+    def __repr__(self):
+        host, port = self.engine.client.addr
+        return f"<Game {self.id} {host}:{port} {self.board!r}>"
+
+    def step(self):
+        wait = self.engine.step()
+        self.board.set_gate(self.engine.gate["mode1"], self.engine.gate["mode2"])
+        self.updater.ok()
+        return wait
+
+    def health(self):
+        return health.check(self.engine.client, self.updater)
+
+
+def load_config(path=CONFIG_PATH):
+    with open(path, encoding="utf-8") as f:
+        conf = json.load(f)
+    games = [Game(g["id"], g.get("host", DEFAULT_HOST), g["port"],
+                  g.get("home_name", "HOME"), g.get("away_name", "AWAY")) for g in conf["games"]]
+    if len({g.id for g in games}) != len(games):
+        raise ValueError("duplicate game id")
+    http = tuple(conf.get("http", (HTTP_HOST, HTTP_PORT)))
+    return games, http
+
+
+class Collector:
+    def __init__(self, games):
+        self.games = {g.id: g for g in games}
+        self.order = list(self.games)   # /games.json の並び
+        self.steps = 0
+        self._stop = threading.Event()
+
+    def run(self):
+        """各試合の step() を、返ってきた待ち時間どおりに1本のスレッドで回す。"""
+        due = [(time.monotonic(), i, g) for i, g in enumerate(self.games.values())]
+        heapq.heapify(due)
+        while not self._stop.is_set():
+            at, i, g = heapq.heappop(due)
+            wait = at - time.monotonic()
+            if wait > 0 and self._stop.wait(wait):
+                break
+            try:
+                nxt = g.step()
+            except Exception as e:
+                # 1試合の失敗で全体を止めない
+                print(f"{g.id}: step failed: {e!r}")
+                g.updater.error(e)
+                nxt = 1.0
+            self.steps += 1
+            heapq.heappush(due, (time.monotonic() + nxt, i, g))
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def combined(self):
+        """/games.json の本文と ETag（各試合の作り置き JSON をつなぐだけ）。"""
+        parts = []
+        versions = []
+        for gid in self.order:
+            body, _, version = self.games[gid].board.snapshot()
+            parts.append(b'"%s":%s' % (gid.encode("ascii"), body))
+            versions.append(str(version))
+        return b"{" + b",".join(parts) + b"}", f'"{BOOT_ID}-{".".join(versions)}"'
+
+
+COLLECTOR = None
+
+
+class CollectorHandler(Handler):
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+
+        if path == "/health":
+            self._send_health({gid: COLLECTOR.games[gid].health() for gid in COLLECTOR.order})
+            return
+
+        if path == "/metrics":
+            games = [COLLECTOR.games[gid] for gid in COLLECTOR.order]
+            self._send_metrics([({"game": g.id}, g.engine.client, g.updater, g.engine, g.board) for g in games])
+            return
+
+        if path == "/games.json":
+            body, etag = COLLECTOR.combined()
+            headers = {"ETag": etag}
+            if self.headers.get("If-None-Match") == etag:
+                self._send(304, "application/json; charset=utf-8", b"", headers)
+                return
+            self._send(200, "application/json; charset=utf-8", body, headers)
+            return
+
+        parts = path.strip("/").split("/")
+        if len(parts) in (2, 3) and parts[0] == "games" and parts[1] in COLLECTOR.games:
+            g = COLLECTOR.games[parts[1]]
+            leaf = parts[2] if len(parts) == 3 else ""
+            if leaf == "state.json":
+                self._send_state(g.board)
+                return
+            if leaf == "state.bin":
+                self._send_compact(g.board)
+                return
+            if leaf == "events":
+                self._stream_events(g.board)
+                return
+            if leaf == "gate.json":
+                self._send_gate(g.board)
+                return
+            if leaf == "poll.json":
+                self._send_poll(g.engine)
+                return
+            if leaf == "health":
+                self._send_health({"": g.health()})
+                return
+            if leaf in ("", "overlay.html"):
+                if not leaf:
+                    # overlay.html の相対パス（state.json / events）がこの試合の下を指すように
+                    self._send(301, "text/plain; charset=utf-8", b"", {"Location": f"/games/{g.id}/overlay.html"})
+                    return
+                self._send_html()
+                return
+
+        if path == "/":
+            links = "".join(f'<li><a href="/games/{gid}/overlay.html">{gid}</a></li>' for gid in COLLECTOR.order)
+            self._send(200, "text/html; charset=utf-8", f"<ul>{links}</ul>".encode("utf-8"))
+            return
+
+        self._send(404, "text/plain; charset=utf-8", b"not found")
+
+
+def main(argv):
+    global COLLECTOR
+    path = argv[1] if len(argv) > 1 else CONFIG_PATH
+    if not os.path.exists(path):
+        print(f"config not found: {path} (see the example at the top of collector.py)")
+        return 2
+    games, (host, port) = load_config(path)
+    COLLECTOR = Collector(games).start()
+    httpd = ThreadingHTTPServer((host, port), CollectorHandler)
+    print(f"Collector running: {len(games)} games")
+    for g in games:
+        print(f"  {g.id}: {g.engine.client.addr[0]}:{g.engine.client.addr[1]} -> http://{host}:{port}/games/{g.id}/overlay.html")
+    httpd.serve_forever()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
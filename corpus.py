@@ -0,0 +1,180 @@
+import json
+import mmap
+import os
+import sys
+
+from memmap import WRAM_BASE, WRAM_SIZE
+from snapstore import SnapStore, labels_from_file
+
+# 保存済みスナップショットを「サンプル × アドレス」の1枚の行列として扱う（アドレス探索用）。
+#
+# 行列はアドレスごとに並べ替えた（転置した）形でファイルに置き、mmap で開く。
+#   column(addr) … そのアドレスの全サンプルの値（連続した memoryview。コピーなし）
+#   row(i)       … i 番目のスナップショット（飛び飛びの memoryview。コピーなし）
+# ラベルは labels[i]（dict）で、行と同じ順番。
+#
+# キャッシュは元のアーカイブ/フォルダが更新されたときだけ作り直す。
+
+CACHE_PATH = "score_snaps/corpus.bin"   # 隣に .json（ラベルと元ファイルの情報）を置く
+SOURCES = ("score_snaps/archive.snap",)
+
+
+def _stamp(path):
+    # 作り直しの判定用（フォルダなら中の .bin 全部）
+    if os.path.isdir(path):
+        names = sorted(n for n in os.listdir(path) if n.endswith(".bin"))
+        return [[n, os.path.getsize(os.path.join(path, n)), os.path.getmtime(os.path.join(path, n))]
+                for n in names]
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime]
+
+
+def read_sources(sources):
+    """(labels, 行優先の bytearray) を返す。"""
+    labels = []
+    rows = bytearray()
+    for src in sources:
+        if os.path.isdir(src):
+            got = []
+            for n in sorted(os.listdir(src)):
+                if not n.endswith(".bin"):
+                    continue
+                r = labels_from_file(os.path.join(src, n))
+                if r is not None and len(r[2]) == WRAM_SIZE:
+                    got.append(r)
+            got.sort(key=lambda r: r[0])
+            for ts, lab, snap in got:
+                labels.append(dict(lab, ts=ts, source=src))
+                rows += snap
+        else:
+            store = SnapStore(src)
+            for e, snap in store.frames():
+                if len(snap) != WRAM_SIZE:
+                    continue
+                labels.append(dict(e.labels, ts=e.ts, source=src, index=e.i))
+                rows += snap
+    return labels, rows
+
+
+def build(sources=SOURCES, path=CACHE_PATH):
+    """sources を読んで転置した行列とラベルを書き出す。"""
+    labels, rows = read_sources(sources)
+    n = len(labels)
+    cols = bytearray(n * WRAM_SIZE)
+    for off in range(WRAM_SIZE):
+        cols[off * n:(off + 1) * n] = rows[off::WRAM_SIZE]
+
+    d = os.path.dirname(path)
+    if d:
+        os.makedirs(d, exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(cols)
+    meta = {
+        "n": n,
+        "size": WRAM_SIZE,
+        "base": WRAM_BASE,
+        "sources": {s: _stamp(s) for s in sources},
+        "labels": labels,
+    }
+    with open(path + ".json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    return n
+
+
+class Corpus:
+    """
+    mmap した転置行列。
+
+    c = load()
+    c.column(0xD262)          # memoryview（n バイト、サンプル順）
+    c.values("bases")         # ラベルの列（行と同じ順番）
+    c.subset(lambda lab: ...) # 条件に合う行番号
+    """
+
+    def __init__(self, path=CACHE_PATH):
+        with open(path + ".json", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.path = path
+        self.n = meta["n"]
+        self.size = meta["size"]
+        self.base = meta["base"]
+        self.labels = meta["labels"]
+        self._f = open(path, "rb")
+        if self.n:
+            self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.cols = memoryview(self._mm)
+        else:
+            self._mm = None
+            self.cols = memoryview(b"")
+
+    def __len__(self):
+        return self.n
+
+    def __repr__(self):
+        return f"<Corpus {self.n} snapshots x {self.size:#x} bytes from {self.base:04X}>"
+
+    def close(self):
+        self.cols.release()
+        if self._mm is not None:
+            self._mm.close()
+        self._f.close()
+
+    def column(self, addr):
+        off = addr - self.base
+        return self.cols[off * self.n:(off + 1) * self.n]
+
+    def column_at(self, off):
+        return self.cols[off * self.n:(off + 1) * self.n]
+
+    def row(self, i):
+        return self.cols[i::self.n]
+
+    def take(self, rows):
+        """rows の行だけを抜き出した転置行列（bytes）。全行なら mmap をそのまま返す。"""
+        if len(rows) == self.n and list(rows) == list(range(self.n)):
+            return self.cols
+        m = len(rows)
+        out = bytearray(m * self.size)
+        for k, i in enumerate(rows):
+            out[k::m] = self.cols[i::self.n]
+        return out
+
+    def values(self, key):
+        return [lab.get(key) for lab in self.labels]
+
+    def subset(self, fn):
+        return [i for i, lab in enumerate(self.labels) if fn(lab)]
+
+
+def is_stale(sources=SOURCES, path=CACHE_PATH):
+    if not (os.path.exists(path) and os.path.exists(path + ".json")):
+        return True
+    with open(path + ".json", encoding="utf-8") as f:
+        meta = json.load(f)
+    have = meta.get("sources", {})
+    if list(have) != list(sources):
+        return True
+    return any(not os.path.exists(s) or have[s] != _stamp(s) for s in sources)
+
+
+def load(sources=SOURCES, path=CACHE_PATH):
+    """必要なら作り直してから Corpus を開く。"""
+    if is_stale(sources, path):
+        build(sources, path)
+    return Corpus(path)
+
+
+def main(argv):
+    # python corpus.py [SOURCE ...]   （既定は score_snaps/archive.snap）
+    sources = tuple(argv[1:]) or SOURCES
+    c = load(sources)
+    print(c)
+    keys = sorted({k for lab in c.labels for k in lab} - {"ts", "source", "index", "file", "note"})
+    for k in keys:
+        vals = [v for v in c.values(k) if v is not None]
+        print(f"  {k}: {len(vals)} labeled, {len(set(map(str, vals)))} distinct")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
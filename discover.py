@@ -0,0 +1,338 @@
+import heapq
+import sys
+import time
+from collections import Counter
+
+import corpus as corpus_mod
+from heatmap import load_volatile_mask
+
+# 保存済みスナップショット（corpus.py）から、ラベルと連動するアドレスを WRAM 全体で探す。
+# old/bb.py（ビット・非0・値→ラベル表）と old/bbkkk.py（1つ抜き交差検証）の判定を、
+# アドレスごとのループではなく行列全体への一括処理で行う。
+#
+#   python discover.py bases                    # 塁（3bit マスク）
+#   python discover.py on1 score_snaps/archive.snap old/snaps
+#   python discover.py away
+#
+# ラベル名は corpus のラベルのキー（home, away, balls, strikes, outs, bases, inning ...）か、
+# 下の DERIVED_TARGETS。新しい項目（スタミナなど）もラベルを付けて保存すればそのまま探せる。
+
+TOP_N = 30
+MIN_SCORE = 0.80
+UNIQ_FREE = 8         # ユニーク値がこれを超えると少しずつ減点（タイマ除け）
+UNIQ_PENALTY = 0.02
+
+
+def _half(lab):
+    if lab.get("inning") is None or lab.get("side") is None:
+        return None
+    return (lab["inning"] - 1) * 2 + (1 if lab["side"] == "裏" else 0)
+
+
+def _base_bit(bit):
+    def fn(lab):
+        m = lab.get("bases")
+        return None if m is None else (m >> bit) & 1
+    return fn
+
+
+DERIVED_TARGETS = {
+    "half": _half,
+    "on1": _base_bit(0),
+    "on2": _base_bit(1),
+    "on3": _base_bit(2),
+}
+
+
+def _table(fn):
+    return bytes(1 if fn(v) else 0 for v in range(256))
+
+
+# 0/1 を当てる単純な判定（値 → 0/1 の変換表）。反転は一致数から計算する
+BINARY_PREDICATES = [(f"bit{b}", _table(lambda v, b=b: (v >> b) & 1)) for b in range(8)] + [
+    ("!=0", _table(lambda v: v != 0)),
+    ("!=FF", _table(lambda v: v != 0xFF)),
+]
+INVERSE_NAME = {"!=0": "==0", "!=FF": "==FF"}
+
+
+def target_values(c, key):
+    fn = DERIVED_TARGETS.get(key)
+    if fn is not None:
+        return [fn(lab) for lab in c.labels]
+    return c.values(key)
+
+
+def _xor_bytes(a_int, b_int, n):
+    return (a_int ^ b_int).to_bytes(n, "little")
+
+
+def _per_column_count(buf, byte, n, size):
+    # buf をアドレスごと（長さ n）に区切って byte の個数を数える
+    cnt = buf.count
+    needle = bytes([byte])
+    return [cnt(needle, off * n, off * n + n) for off in range(size)]
+
+
+def binary_scores(mat, y, n, size):
+    """
+    y: サンプルごとの 0/1（bytes）
+    戻り値: アドレスごとの (一致数, 判定名)。各判定は反転も含めた良い方。
+    """
+    total = n * size
+    y_int = int.from_bytes(y * size, "little")
+    best = [(0, "")] * size
+    for name, table in BINARY_PREDICATES:
+        pred = mat.translate(table)
+        miss = _per_column_count(_xor_bytes(int.from_bytes(pred, "little"), y_int, total), 1, n, size)
+        inv = INVERSE_NAME.get(name, f"{name}=0(invert)")
+        pos = name if name in INVERSE_NAME else f"{name}=1"
+        for off, m in enumerate(miss):
+            hit = n - m
+            if hit > best[off][0]:
+                best[off] = (hit, pos)
+            if m > best[off][0]:
+                best[off] = (m, inv)
+    return best
+
+
+def identity_scores(mat, y, n, size):
+    """値そのものがラベル（スコアや B/S/O をそのまま持っている）ときの一致数。"""
+    total = n * size
+    diff = _xor_bytes(int.from_bytes(mat, "little"), int.from_bytes(y * size, "little"), total)
+    return _per_column_count(diff, 0, n, size)
+
+
+def pair_counts(mat, classes, n, size):
+    """
+    アドレスごとの (値, ラベル) の出現数。
+    値とクラス番号を 16bit に詰めて、アドレスごとに Counter（C 実装の数え上げ）に通す。
+    """
+    packed = bytearray(2 * n * size)
+    lo, hi = (0, 1) if sys.byteorder == "little" else (1, 0)
+    packed[lo::2] = mat
+    packed[hi::2] = bytes(classes) * size
+    mv = memoryview(packed).cast("H")
+    return [Counter(mv[off * n:off * n + n]) for off in range(size)]
+
+
+def lookup_accuracy(counts, global_counts):
+    """
+    (値, ラベル) の数え上げから、値→ラベル表（多数決）の
+    当てはまり（学習データそのもの）と 1つ抜き交差検証の正解数を求める。
+    1つ抜きでは、その値が1回しか出ていなければ全体の多数決で予測する。同数は外れ扱い。
+    """
+    byval = {}
+    for key, k in counts.items():
+        byval.setdefault(key & 0xFF, {})[key >> 8] = k
+
+    fit = 0
+    loo = 0
+    for labs in byval.values():
+        fit += max(labs.values())
+        total = sum(labs.values())
+        for c, k in labs.items():
+            if total == 1:
+                # 全体の多数決（自分を抜いた数）
+                g = global_counts[c] - 1
+                if all(g > v for c2, v in global_counts.items() if c2 != c):
+                    loo += 1
+                continue
+            rest = k - 1
+            if all(rest > v for c2, v in labs.items() if c2 != c):
+                loo += k
+    return fit, loo, len(byval)
+
+
+def _contrib(labs):
+    # 2回以上出ている値の、1つ抜き正解数（lookup_accuracy の total >= 2 の分と同じ）
+    n = 0
+    for c, k in labs.items():
+        rest = k - 1
+        if all(rest > v for c2, v in labs.items() if c2 != c):
+            n += k
+    return n
+
+
+class IncrementalLoo:
+    """
+    1サンプルずつ追加/削除しながら、全アドレスの 1つ抜き交差検証の正解数を保つ。
+    lookup_accuracy と同じ値になるが、追加1回の手間はアドレス数に比例するだけ
+    （サンプル数の2乗にならない）。
+
+    アドレスごとに持つもの:
+      tables[off]  値 -> {ラベル: 回数}
+      multi[off]   2回以上出ている値の正解数の合計
+      single[off]  {ラベル: 1回しか出ていない値の数}（全体の多数決で当たるかはラベルだけで決まる）
+    """
+
+    def __init__(self, size, base=0):
+        self.size = size
+        self.base = base
+        self.n = 0
+        self.global_counts = Counter()
+        self.tables = [{} for _ in range(size)]
+        self.multi = [0] * size
+        self.single = [Counter() for _ in range(size)]
+
+    def _update(self, snap, label, delta):
+        tables, multi, single = self.tables, self.multi, self.single
+        for off, v in enumerate(snap[:self.size]):
+            labs = tables[off].get(v)
+            if labs is None:
+                labs = tables[off][v] = {}
+            total = sum(labs.values())
+            if total == 1:
+                single[off][next(iter(labs))] -= 1
+            elif total >= 2:
+                multi[off] -= _contrib(labs)
+
+            k = labs.get(label, 0) + delta
+            if k:
+                labs[label] = k
+            else:
+                del labs[label]
+            total += delta
+
+            if total == 1:
+                single[off][next(iter(labs))] += 1
+            elif total >= 2:
+                multi[off] += _contrib(labs)
+            elif total == 0:
+                del tables[off][v]
+        self.global_counts[label] += delta
+        if not self.global_counts[label]:
+            del self.global_counts[label]
+        self.n += delta
+
+    def add(self, snap, label):
+        self._update(snap, label, 1)
+
+    def remove(self, snap, label):
+        """add の取り消し（同じ snap と label を渡す）。"""
+        self._update(snap, label, -1)
+
+    def _wins(self):
+        # 自分を1つ抜いても全体の多数決で勝つラベル
+        g = self.global_counts
+        return {c for c, k in g.items() if all(k - 1 > v for c2, v in g.items() if c2 != c)}
+
+    def loo(self):
+        """アドレスごとの 1つ抜き正解数。"""
+        wins = self._wins()
+        return [m + sum(k for c, k in s.items() if c in wins) for m, s in zip(self.multi, self.single)]
+
+    def leaderboard(self, top_n=TOP_N, exclude=None):
+        """[(score, addr, 1つ抜き正解率, ユニーク値数)] を良い順に。exclude[off] が真のアドレスは除く。"""
+        if self.n == 0:
+            return []
+        ranked = []
+        multi_label = len(self.global_counts) > 1
+        for off, correct in enumerate(self.loo()):
+            if exclude is not None and exclude[off]:
+                continue
+            uniq = len(self.tables[off])
+            if uniq <= 1 and multi_label:
+                continue
+            acc = correct / self.n
+            score = acc - UNIQ_PENALTY * max(0, uniq - UNIQ_FREE)
+            ranked.append((score, self.base + off, acc, uniq))
+        return heapq.nlargest(top_n, ranked, key=lambda x: (x[0], x[2], -x[1]))
+
+
+def discover(c, key, top_n=TOP_N, min_score=MIN_SCORE, exclude=None):
+    """
+    corpus c のラベル key に対して全アドレスを評価し、候補を良い順に返す。
+    exclude[off] が真のアドレス（heatmap.py のノイズ扱いのバイトなど）は候補にしない。
+    候補: (score, addr, 判定の説明, 単純判定の正解率, 1つ抜き正解率, ユニーク値数, ラベルごとの代表値)
+    """
+    ys = target_values(c, key)
+    rows = [i for i, v in enumerate(ys) if v is not None]
+    n = len(rows)
+    if n < 2:
+        raise ValueError(f"not enough labeled samples for {key!r}: {n}")
+    ys = [ys[i] for i in rows]
+    mat = bytes(c.take(rows))   # translate / int.from_bytes 用に1回だけ実体化
+    size = c.size
+
+    # ラベルをクラス番号に（出てきた順）
+    classes_of = {}
+    for v in ys:
+        classes_of.setdefault(v, len(classes_of))
+    if len(classes_of) > 255:
+        raise ValueError(f"too many distinct labels for {key!r}: {len(classes_of)}")
+    classes = [classes_of[v] for v in ys]
+    names = {i: v for v, i in classes_of.items()}
+    global_counts = Counter(classes)
+
+    simple = [(0, "")] * size
+    if set(ys) <= {0, 1, True, False}:
+        simple = binary_scores(mat, bytes(int(v) for v in ys), n, size)
+    elif all(isinstance(v, int) and 0 <= v <= 255 for v in ys):
+        ident = identity_scores(mat, bytes(ys), n, size)
+        simple = [(h, "value==label") for h in ident]
+
+    counts = pair_counts(mat, classes, n, size)
+    out = []
+    for off in range(size):
+        if exclude is not None and exclude[off]:
+            continue
+        fit, loo, uniq = lookup_accuracy(counts[off], global_counts)
+        if uniq <= 1 and len(global_counts) > 1:
+            continue
+        simple_acc = simple[off][0] / n
+        loo_acc = loo / n
+        loo_score = loo_acc - UNIQ_PENALTY * max(0, uniq - UNIQ_FREE)
+        if simple_acc >= loo_score:
+            score, how = simple_acc, simple[off][1]
+        else:
+            score, how = loo_score, "value->label lookup"
+        if score < min_score:
+            continue
+
+        # ラベルごとに一番多い値（参考表示）
+        bylab = {}
+        for k, cnt in counts[off].items():
+            lab = names[k >> 8]
+            if cnt > bylab.get(lab, (None, 0))[1]:
+                bylab[lab] = (k & 0xFF, cnt)
+        summary = " ".join(f"{lab}:{v:02X}({cnt})" for lab, (v, cnt) in
+                           sorted(bylab.items(), key=lambda x: str(x[0])))
+        out.append((score, c.base + off, how, simple_acc, loo_acc, uniq, summary))
+
+    out.sort(key=lambda x: (-x[0], -x[4], x[1]))
+    return out[:top_n] if top_n else out
+
+
+def main(argv):
+    if len(argv) < 2:
+        print("usage: python discover.py LABEL [SOURCE ...]")
+        print("  LABEL: corpus のラベル名（home, away, balls, strikes, outs, bases ...）か "
+              + ", ".join(DERIVED_TARGETS))
+        return 2
+    key = argv[1]
+    sources = tuple(argv[2:]) or corpus_mod.SOURCES
+    c = corpus_mod.load(sources)
+
+    # heatmap.py で取ったノイズ（タイマなど）のバイトは最初から外す
+    mask = load_volatile_mask()
+    t0 = time.perf_counter()
+    cands = discover(c, key, exclude=mask)
+    dt = time.perf_counter() - t0
+
+    n = sum(1 for v in target_values(c, key) if v is not None)
+    print(f"{c!r}  label={key}  samples={n}  ({dt * 1000:.0f} ms)")
+    if mask is not None:
+        print(f"excluded {mask.count(1)} volatile bytes (heatmap)")
+    print(f"\n=== TOP CANDIDATES (score >= {MIN_SCORE:.2f}) ===")
+    if not cands:
+        print("候補なし。ラベル付きのサンプルを増やす（同じ状態も複数回）と当たりが出やすくなります。")
+        return 0
+    for score, addr, how, simple_acc, loo_acc, uniq, summ in cands:
+        print(f"score={score:.3f}  addr={addr:04X}  {how:<20s} simple={simple_acc * 100:5.1f}%  "
+              f"loocv={loo_acc * 100:5.1f}%  uniq={uniq:3d}  {summ}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,245 @@
+import glob
+import os
+import struct
+import sys
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from gamestate import COMMIT, GATE_CHANGED
+from memmap import half_to_inning_side
+from snapstore import bases_mask
+
+# 確定値とゲートの変化を、固定長レコードの追記専用ファイルに残す（1試合 = 1ファイル）。
+#
+#   ファイル先頭: MAGIC
+#   以降は REC の繰り返し（24 バイト）:
+#     ts, frame, kind, flags, mode1, mode2, balls, strikes, outs, half, bases, home, away
+#
+# どのレコードにもその時点の確定値が全部入っている（ゲートのレコードは直前の確定値を写す）ので、
+# 途中の1件だけ見てもオーバーレイを描ける。読めていない値は UNKNOWN。
+#
+#   python eventlog.py                 # 最新の試合のボックススコアと得点経過
+#   python eventlog.py gamelogs/xxx.evl
+
+LOG_DIR = "gamelogs"
+SUFFIX = ".evl"
+
+MAGIC = b"FEVLv1\n\0"
+REC = struct.Struct("<dIBBBBBBBBBBBx")
+UNKNOWN = 0xFF
+NO_FRAME = 0xFFFFFFFF
+
+# kind
+K_COMMIT, K_GATE = 1, 2
+# flags
+F_CONSISTENT = 1   # 同じフレームの値として読めた
+F_READY = 2        # 投球可能
+
+Rec = namedtuple("Rec", "ts frame kind flags mode1 mode2 balls strikes outs half bases home away")
+
+
+def _b(v):
+    return UNKNOWN if v is None else int(v) & 0xFF
+
+
+def pack(kind, state, gate, ts=None):
+    """確定値 state（無ければ None）とゲート値 gate から1レコード作る。"""
+    st = state or {}
+    flags = (F_CONSISTENT if st.get("consistent") else 0) | (F_READY if gate.get("ready") else 0)
+    frame = st.get("frame")
+    bases = bases_mask(st["on1"], st["on2"], st["on3"]) if "on1" in st else UNKNOWN
+    return REC.pack(time.time() if ts is None else ts,
+                    NO_FRAME if frame is None else frame,
+                    kind, flags, _b(gate.get("mode1")), _b(gate.get("mode2")),
+                    _b(st.get("balls")), _b(st.get("strikes")), _b(st.get("outs")), _b(st.get("half")),
+                    bases, _b(st.get("home")), _b(st.get("away")))
+
+
+def new_game(prev, state):
+    """prev から state で試合が変わったか（回が戻った、どちらかのスコアが減った）。"""
+    if prev is None:
+        return False
+    for k in ("half", "home", "away"):
+        if k in prev and k in state and state[k] < prev[k]:
+            return True
+    return False
+
+
+class EventLog:
+    """
+    エンジンに subscribe して、確定値とゲートの変化を書き足す。
+    試合が変わったら（new_game）新しいファイルにする。
+
+        log = EventLog().attach(engine)
+    """
+
+    def __init__(self, log_dir=LOG_DIR):
+        self.log_dir = log_dir
+        self.path = None
+        self.f = None
+        self.state = None
+        self.gate = {}
+        self.records = 0
+
+    def __repr__(self):
+        return f"<EventLog {self.path} records={self.records}>"
+
+    def attach(self, engine):
+        engine.subscribe(self.on_event, [COMMIT, GATE_CHANGED])
+        return self
+
+    def rotate(self, ts=None):
+        self.close()
+        os.makedirs(self.log_dir, exist_ok=True)
+        name = datetime.fromtimestamp(time.time() if ts is None else ts).strftime("%Y%m%d_%H%M%S")
+        self.path = os.path.join(self.log_dir, name + SUFFIX)
+        self.f = open(self.path, "ab")
+        if self.f.tell() == 0:
+            self.f.write(MAGIC)
+        self.records = 0
+        print(f"event log: {self.path}")
+
+    def write(self, kind, ts=None):
+        if self.f is None:
+            self.rotate(ts)
+        self.f.write(pack(kind, self.state, self.gate, ts))
+        self.f.flush()
+        self.records += 1
+
+    def on_event(self, ev):
+        if ev.kind == GATE_CHANGED:
+            self.gate = ev.state
+            self.write(K_GATE, ev.ts)
+            return
+        if new_game(self.state, ev.state):
+            self.rotate(ev.ts)
+        self.state = ev.state
+        self.write(K_COMMIT, ev.ts)
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+
+
+# ====== 読み出し ======
+
+def game_logs(log_dir=LOG_DIR):
+    """試合ごとのファイルを古い順に。"""
+    return sorted(glob.glob(os.path.join(log_dir, "*" + SUFFIX)))
+
+
+def load(path):
+    """ファイル全体を Rec の list にする（途中で切れた最後のレコードは捨てる）。"""
+    with open(path, "rb") as f:
+        data = f.read()
+    if not data.startswith(MAGIC):
+        raise ValueError(f"not an event log: {path}")
+    end = len(MAGIC) + (len(data) - len(MAGIC)) // REC.size * REC.size
+    return list(map(Rec._make, REC.iter_unpack(memoryview(data)[len(MAGIC):end])))
+
+
+def commits(recs):
+    return [r for r in recs if r.kind == K_COMMIT]
+
+
+def to_state(r):
+    """レコードをエンジンの確定値と同じ形の dict にする（overlay の on_commit にそのまま渡せる）。"""
+    def v(x):
+        return None if x == UNKNOWN else x
+    st = {
+        "home": v(r.home), "away": v(r.away),
+        "half": v(r.half), "inning": None, "side": None,
+        "balls": v(r.balls), "strikes": v(r.strikes), "outs": v(r.outs),
+        "on1": None, "on2": None, "on3": None,
+        "mode1": v(r.mode1), "mode2": v(r.mode2),
+        "frame": None if r.frame == NO_FRAME else r.frame,
+        "consistent": bool(r.flags & F_CONSISTENT),
+        "updated_at": r.ts,
+    }
+    if st["half"] is not None:
+        st["inning"], st["side"] = half_to_inning_side(st["half"])
+    if r.bases != UNKNOWN:
+        st["on1"], st["on2"], st["on3"] = bool(r.bases & 1), bool(r.bases & 2), bool(r.bases & 4)
+    return st
+
+
+def run_timeline(recs):
+    """
+    得点経過 [(ts, frame, inning, side, "away"/"home", 入った点, away, home)]。
+    点は次の確定値で見えるので、攻撃側の回（away は直前の表、home は直前の裏）に付ける。
+    """
+    out = []
+    prev = None
+    for r in commits(recs):
+        if UNKNOWN in (r.home, r.away, r.half):
+            continue
+        if prev is not None:
+            for team, now, before in (("away", r.away, prev.away), ("home", r.home, prev.home)):
+                if now > before:
+                    half = r.half - (r.half % 2) if team == "away" else r.half - 1 + (r.half % 2)
+                    inning, side = half_to_inning_side(max(0, half))
+                    out.append((r.ts, None if r.frame == NO_FRAME else r.frame,
+                                inning, side, team, now - before, r.away, r.home))
+        prev = r
+    return out
+
+
+def box_score(recs):
+    """
+    ボックススコア {"innings": 回数, "away": [回ごとの点], "home": [...], "R": (away, home), "pitches": 確定値の数}。
+    """
+    cs = [r for r in commits(recs) if r.half != UNKNOWN]
+    innings = max((r.half // 2 + 1 for r in cs), default=0)
+    line = {"away": [0] * innings, "home": [0] * innings}
+    for _, _, inning, _, team, runs, _, _ in run_timeline(recs):
+        line[team][inning - 1] += runs
+    last = cs[-1] if cs else None
+    total = (last.away, last.home) if last else (0, 0)
+    return {"innings": innings, "away": line["away"], "home": line["home"], "R": total, "pitches": len(cs)}
+
+
+def replay(recs, fn, speed=1.0):
+    """
+    記録した間隔の 1/speed で fn(Rec) を順に呼ぶ。speed が None / 0 なら待たない。
+    overlay.py の REPLAY_PATH はこれで試合を再生する。
+    """
+    t0 = time.monotonic()
+    first = recs[0].ts if recs else 0.0
+    for r in recs:
+        if speed:
+            wait = (r.ts - first) / speed - (time.monotonic() - t0)
+            if wait > 0:
+                time.sleep(wait)
+        fn(r)
+
+
+def print_box(box, away_name="AWAY", home_name="HOME"):
+    head = " ".join(f"{i + 1:>2}" for i in range(box["innings"]))
+    print(f"{'':6} {head}   R")
+    for name, key, r in ((away_name, "away", box["R"][0]), (home_name, "home", box["R"][1])):
+        print(f"{name:6} {' '.join(f'{x:>2}' for x in box[key])}  {r:>2}")
+
+
+def main(argv):
+    paths = argv[1:] or game_logs()[-1:]
+    if not paths:
+        print(f"no event logs in {LOG_DIR}")
+        return 1
+    for path in paths:
+        t0 = time.perf_counter()
+        recs = load(path)
+        box = box_score(recs)
+        runs = run_timeline(recs)
+        ms = (time.perf_counter() - t0) * 1000
+        print(f"{path}: {len(recs)} records, {box['pitches']} commits ({ms:.1f} ms)")
+        print_box(box)
+        for ts, frame, inning, side, team, n, away, home in runs:
+            at = datetime.fromtimestamp(ts).strftime("%H:%M:%S")
+            print(f"  {at} {inning}回{side} {team} +{n}  ({away}-{home})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
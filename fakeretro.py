@@ -0,0 +1,249 @@
+import heapq
+import os
+import random
+import select
+import socket
+import sys
+import threading
+import time
+from bisect import bisect_right
+
+import eventlog
+from corpus import read_sources
+from memmap import FRAME_ADDR, MEMMAP, WRAM_BASE, WRAM_SIZE
+
+# RetroArch の代わりに READ_CORE_MEMORY に答えるローカルの UDP サーバ。
+# 保存済みの WRAM（.bin フォルダ / .bin / archive.snap）を1枚ずつ順に、
+# または eventlog の試合（.evl）を記録した時刻どおりに流す。
+# 遅延・欠落・返事の順番入れ替えを付けられるので、エミュなしで各スクリプトを動かしたり測ったりできる。
+#
+#   python fakeretro.py                                   # score_snaps の .bin を HOLD_SEC ごとに切り替え
+#   python fakeretro.py old/snaps loss=0.05 reorder=0.2
+#   python fakeretro.py gamelogs/xxx.evl speed=10         # 試合を10倍速で（WRAM の残りは空）
+#   python fakeretro.py score_snaps gamelogs/xxx.evl      # 残りは score_snaps の1枚目
+#
+# 既定のポートは RetroArch と同じ 55355（本物と同時に動かすなら port=55356 などにして、
+# 各スクリプトの PORT を合わせる）。
+
+HOST, PORT = "127.0.0.1", 55355
+SOURCES = ("score_snaps",)
+
+LATENCY_SEC = 0.0     # 返事までの遅延
+JITTER_SEC = 0.0      # 遅延に足す一様乱数の幅
+LOSS = 0.0            # 要求を黙って捨てる確率
+REORDER = 0.0         # 返事を後回しにする確率（後の要求の返事に追い越させる）
+REORDER_SEC = 0.005   # 後回しにするときに足す遅延
+MAX_LEN = None        # これより長い要求には -1（RetroArch の上限の真似。None なら無制限）
+HOLD_SEC = 0.5        # スナップショットを流すとき、1枚を見せる時間
+SPEED = 1.0           # 流す速さ（2.0 で倍速）
+FRAME_HZ = 59.73      # FRAME_ADDR を設定していれば、そこにこの速さで進むカウンタを置く
+
+
+def _patch(base, r):
+    # eventlog のレコードの値を memmap のアドレスに書き込む
+    w = bytearray(base)
+    for name in ("mode1", "mode2", "balls", "strikes", "outs", "half", "home", "away"):
+        v = getattr(r, name)
+        if v != eventlog.UNKNOWN:
+            w[MEMMAP.addr(name) - WRAM_BASE] = v
+    if r.bases != eventlog.UNKNOWN:
+        for bit, name in enumerate(("on1", "on2", "on3")):
+            w[MEMMAP.addr(name) - WRAM_BASE] = (r.bases >> bit) & 1
+    return bytes(w)
+
+
+def load_timeline(sources=SOURCES, hold=HOLD_SEC):
+    """
+    [(秒, WRAM)] を時刻順に返す。
+    .evl があればその試合（複数ならつなげる）、無ければスナップショットを hold 秒ずつ。
+    """
+    bins = [s for s in sources if s.endswith(".bin") and os.path.isfile(s)]
+    logs = [s for s in sources if s.endswith(eventlog.SUFFIX)]
+    rest = [s for s in sources if s not in bins and s not in logs]
+
+    frames = []
+    for path in bins:
+        with open(path, "rb") as f:
+            frames.append(f.read())
+    if rest:
+        _, rows = read_sources(rest)
+        frames += [bytes(rows[i:i + WRAM_SIZE]) for i in range(0, len(rows), WRAM_SIZE)]
+    frames = [f for f in frames if len(f) == WRAM_SIZE]
+
+    if not logs:
+        return [(i * hold, f) for i, f in enumerate(frames)]
+
+    base = frames[0] if frames else bytes(WRAM_SIZE)
+    timeline = []
+    offset = 0.0
+    for path in logs:
+        recs = eventlog.load(path)
+        if not recs:
+            continue
+        first = recs[0].ts
+        for r in recs:
+            timeline.append((offset + r.ts - first, _patch(base, r)))
+        offset = timeline[-1][0] + hold
+    return timeline
+
+
+class FakeRetro:
+    """
+    srv = FakeRetro(load_timeline(["old/snaps"]), port=0, loss=0.1).start()
+    client = MemClient(*srv.addr)
+    ...
+    srv.stop()
+
+    port=0 なら空いているポートを使う（srv.addr で分かる）。
+    返事の中身は要求を受け取った時点の WRAM（1要求の中は必ず同じ1枚）。
+    """
+
+    def __init__(self, timeline, host=HOST, port=PORT, latency=LATENCY_SEC, jitter=JITTER_SEC,
+                 loss=LOSS, reorder=REORDER, max_len=MAX_LEN, speed=SPEED, seed=None):
+        if not timeline:
+            raise ValueError("empty timeline")
+        self.times = [t for t, _ in timeline]
+        self.frames = [w for _, w in timeline]
+        # 最後の1枚も前と同じくらい見せてから最初に戻る
+        step = self.times[-1] - self.times[-2] if len(self.times) > 1 else HOLD_SEC
+        self.duration = self.times[-1] + (step or HOLD_SEC)
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.reorder = reorder
+        self.max_len = max_len
+        self.speed = speed
+        self.rng = random.Random(seed)
+        self.stats = {"requests": 0, "replies": 0, "dropped": 0, "reordered": 0, "errors": 0}
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        self.sock.setblocking(False)
+        self.t0 = time.monotonic()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __repr__(self):
+        return f"<FakeRetro {self.addr[0]}:{self.addr[1]} {len(self.frames)} frames {self.stats}>"
+
+    @property
+    def addr(self):
+        return self.sock.getsockname()
+
+    def position(self, now=None):
+        """今見せている WRAM の番号。"""
+        t = ((time.monotonic() if now is None else now) - self.t0) * self.speed
+        return max(0, bisect_right(self.times, t % self.duration) - 1)
+
+    def answer(self, text, now=None):
+        """要求1つへの返事（答えない要求は None）。"""
+        parts = text.split()
+        if len(parts) != 3 or parts[0] != "READ_CORE_MEMORY":
+            return None
+        try:
+            addr, n = int(parts[1], 16), int(parts[2])
+        except ValueError:
+            return None
+        if n < 1 or (self.max_len is not None and n > self.max_len):
+            self.stats["errors"] += 1
+            return f"READ_CORE_MEMORY {addr:x} -1 too many bytes requested".encode("ascii")
+        off = addr - WRAM_BASE
+        if off < 0 or off + n > WRAM_SIZE:
+            self.stats["errors"] += 1
+            return f"READ_CORE_MEMORY {addr:x} -1 no memory descriptor for address".encode("ascii")
+        now = time.monotonic() if now is None else now
+        data = self.frames[self.position(now)][off:off + n]
+        if FRAME_ADDR is not None and addr <= FRAME_ADDR < addr + n:
+            data = bytearray(data)
+            data[FRAME_ADDR - addr] = int((now - self.t0) * self.speed * FRAME_HZ) & 0xFF
+        return (f"READ_CORE_MEMORY {addr:x} " + " ".join(f"{b:02X}" for b in data)).encode("ascii")
+
+    def serve(self):
+        pending = []   # (送る時刻, 通し番号, 返事, 宛先)
+        seq = 0
+        while not self._stop.is_set():
+            wait = max(0.0, pending[0][0] - time.monotonic()) if pending else 0.1
+            r, _, _ = select.select([self.sock], [], [], wait)
+            if r:
+                while True:
+                    try:
+                        data, peer = self.sock.recvfrom(65535)
+                    except (BlockingIOError, InterruptedError):
+                        break
+                    except OSError:
+                        # Windows では相手が閉じたポートへの送信で ConnectionResetError が来る
+                        break
+                    self.stats["requests"] += 1
+                    if self.rng.random() < self.loss:
+                        self.stats["dropped"] += 1
+                        continue
+                    now = time.monotonic()
+                    reply = self.answer(data.decode("ascii", errors="replace").strip(), now)
+                    if reply is None:
+                        continue
+                    delay = self.latency + (self.rng.uniform(0, self.jitter) if self.jitter else 0.0)
+                    if self.reorder and self.rng.random() < self.reorder:
+                        delay += REORDER_SEC
+                        self.stats["reordered"] += 1
+                    seq += 1
+                    heapq.heappush(pending, (now + delay, seq, reply, peer))
+
+            now = time.monotonic()
+            while pending and pending[0][0] <= now:
+                _, _, reply, peer = heapq.heappop(pending)
+                try:
+                    self.sock.sendto(reply, peer)
+                    self.stats["replies"] += 1
+                except OSError:
+                    pass
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.sock.close()
+
+
+OPTIONS = {
+    "host": str, "port": int, "latency": float, "jitter": float, "loss": float,
+    "reorder": float, "max_len": lambda s: int(s, 0), "hold": float, "speed": float, "seed": int,
+}
+
+
+def main(argv):
+    sources, opts = [], {}
+    for a in argv[1:]:
+        k, eq, v = a.partition("=")
+        if eq:
+            if k not in OPTIONS:
+                print(f"unknown option: {k} (use {', '.join(OPTIONS)})")
+                return 2
+            opts[k] = OPTIONS[k](v)
+        else:
+            sources.append(a)
+
+    timeline = load_timeline(sources or SOURCES, hold=opts.pop("hold", HOLD_SEC))
+    if not timeline:
+        print(f"no WRAM in {sources or SOURCES}")
+        return 1
+    srv = FakeRetro(timeline, **opts).start()
+    host, port = srv.addr
+    print(f"fake RetroArch on {host}:{port}/UDP: {len(timeline)} frames over {srv.duration:.1f}s "
+          f"(latency={srv.latency}s loss={srv.loss} reorder={srv.reorder}). Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(5.0)
+            print(f"  frame {srv.position() + 1}/{len(timeline)}  {srv.stats}")
+    except KeyboardInterrupt:
+        pass
+    srv.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,359 @@
+import json
+import queue
+import socket
+import threading
+import time
+
+from memclient import MemClient
+from memmap import (FRAME_ADDR, GATE_VIEW, MEMMAP, SETTLE_K, SETTLE_MAX_SEC, STATE_VIEW, WRAM_BASE,
+                    coherent_read, settle_read)
+from pollsched import PollScheduler
+from wramcap import tune_chunk
+
+# ====== 読み取りタイミング ======
+POLL_SEC = 0.02           # 最速のポーリング間隔（adaptive=False なら常にこれ）
+COMMIT_DELAY_SEC = 0.0    # 立ち上がりから確定読みまで待つ時間（gatetrace.py で測った値を入れる。0 なら即読む）
+
+# ====== 他プロセスへのイベント配信 ======
+EVENT_HOST, EVENT_PORT = "127.0.0.1", 55400
+CLIENT_QUEUE = 64               # 購読者ごとの送信待ちの上限（溢れたら切断）
+RECONNECT_SEC = (0.5, 1.0, 2.0) # つながらないときの再試行間隔。尽きたら自前ポーリング
+
+# ====== イベント種別 ======
+PITCH_READY = "pitch_ready"   # F->P の立ち上がり（state は直前の確定値）
+COMMIT = "commit"             # 確定値を読み終えた
+COUNT_CHANGED = "count"       # B/S/O が変わった
+HALF_CHANGED = "half"         # 表裏/回が変わった
+RUN_SCORED = "run"            # どちらかの得点が増えた
+BASES_CHANGED = "bases"       # 塁状況が変わった
+GATE_CHANGED = "gate"         # ゲートの生の値が変わった（state はゲートの dict）
+
+KINDS = (PITCH_READY, COMMIT, COUNT_CHANGED, HALF_CHANGED, RUN_SCORED, BASES_CHANGED, GATE_CHANGED)
+
+STATE_KEYS = (
+    "home", "away", "inning", "side", "half",
+    "balls", "strikes", "outs", "on1", "on2", "on3",
+)
+
+
+def is_ready(gate):
+    return bool(gate.get("ready"))
+
+
+class Event:
+    """エンジンが配るイベント。state は確定値の dict（コピー）、prev は1つ前の確定値。"""
+
+    __slots__ = ("kind", "ts", "state", "prev")
+
+    def __init__(self, kind, state, prev=None, ts=None):
+        self.kind = kind
+        self.state = state
+        self.prev = prev
+        self.ts = time.time() if ts is None else ts
+
+    def __repr__(self):
+        return f"<Event {self.kind} {self.state}>"
+
+    def to_json(self):
+        return json.dumps({"kind": self.kind, "ts": self.ts, "state": self.state, "prev": self.prev},
+                          ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, line):
+        d = json.loads(line)
+        return cls(d["kind"], d["state"], d.get("prev"), d.get("ts"))
+
+
+def _changed(prev, state, keys):
+    return any(k in state and (prev is None or prev.get(k) != state[k]) for k in keys)
+
+
+def diff_events(prev, state):
+    """確定値どうしを比べて、変化に対応するイベント種別を返す（読んでいない項目は見ない）。"""
+    kinds = []
+    if _changed(prev, state, ("balls", "strikes", "outs")):
+        kinds.append(COUNT_CHANGED)
+    if _changed(prev, state, ("half",)):
+        kinds.append(HALF_CHANGED)
+    if prev is not None and any(k in state and k in prev and state[k] > prev[k] for k in ("home", "away")):
+        kinds.append(RUN_SCORED)
+    if _changed(prev, state, ("on1", "on2", "on3")):
+        kinds.append(BASES_CHANGED)
+    return kinds
+
+
+class GameEngine:
+    """
+    投球可能ゲートのポーリングと F->P 立ち上がり検出を1か所で持つ。
+    確定値を読んだらイベントにして、登録された購読者全員に配る。
+
+    読む範囲は購読側に合わせて変えられる:
+      gate_view / ready_fn  立ち上がりの判定（既定は C0D3 と C0CE の両方）
+      view                  立ち上がり後に読む確定値（None なら読まない）
+      scores                スコアも読むか
+    確定値は view とスコアを1つの読み取り計画にまとめ、coherent=True なら同じフレームの値として
+    1回で読む（memmap.coherent_read。1要求に収まるよう RetroArch が返せる長さでまとめる）。
+    確定値には frame（FRAME_ADDR があれば）と consistent（同じフレームの値か）が付く。
+    1要求に収まらず FRAME_ADDR も無いとき、または coherent=False なら、settle_k 回続けて
+    一致した時点で確定する（最長 settle_max 秒）。固定の待ち時間は入れない。
+    adaptive=True なら間隔は pollsched.PollScheduler が決める（最速が poll_sec）。
+    commit_delay > 0 なら、確定読みは立ち上がりからその秒数あとの step で行う（その間もゲートは読み続ける）。
+    """
+
+    def __init__(self, client=None, poll_sec=POLL_SEC, scores=True, view=STATE_VIEW,
+                 gate_view=GATE_VIEW, ready_fn=is_ready, adaptive=True,
+                 settle_k=SETTLE_K, settle_max=SETTLE_MAX_SEC, coherent=True,
+                 commit_delay=COMMIT_DELAY_SEC):
+        self.client = client or MemClient()
+        self.poll_sec = poll_sec
+        self.scores = scores
+        self.view = view
+        self.gate_view = gate_view
+        self.ready_fn = ready_fn
+        self.scheduler = PollScheduler(fast=poll_sec) if adaptive else None
+        self.settle_k = settle_k
+        self.settle_max = settle_max
+        self.coherent = coherent
+        self.commit_delay = commit_delay
+        self.commit_due = None  # 確定読みの予定時刻（monotonic）
+
+        names = (view.names if view is not None else ()) + (("home", "away") if scores else ())
+        gated = view.gated if view is not None else False
+        self.commit_view = MEMMAP.view(*names, gated=gated) if names else None
+        self._coherent_view = None   # 最初の確定読みで作る（RetroArch に長さを問い合わせるので）
+        self.last_read = None  # {"mode", "reads", "ms", "consistent", "frame"}
+
+        self.subscribers = []   # [(fn, kinds or None)]
+        self.prev_ready = False
+        self.gate = {"mode1": None, "mode2": None, "ready": False}
+        self.prev_gate = None   # (mode1, mode2)
+        self.state = None       # 最後の確定値
+        self.last_home = None
+        self.last_away = None
+
+    def subscribe(self, fn, kinds=None):
+        """fn(event) を登録する。kinds を渡すとその種別だけ届く。"""
+        self.subscribers.append((fn, set(kinds) if kinds else None))
+        return fn
+
+    def unsubscribe(self, fn):
+        self.subscribers = [(f, k) for f, k in self.subscribers if f is not fn]
+
+    def publish(self, ev):
+        for fn, kinds in list(self.subscribers):
+            if kinds is not None and ev.kind not in kinds:
+                continue
+            try:
+                fn(ev)
+            except Exception as e:
+                print(f"subscriber error ({ev.kind}): {e!r}")
+
+    def coherent_view(self):
+        """
+        確定値を1要求で読む view（FRAME_ADDR があればそれも含める）。
+        1要求に収まらず FRAME_ADDR も無ければ False（settle_read を使う）。
+        RetroArch に読めないときは RuntimeError。
+        """
+        if self._coherent_view is None:
+            chunk = tune_chunk(self.client, WRAM_BASE)
+            names = self.commit_view.names + (("frame",) if FRAME_ADDR is not None else ())
+            view = MEMMAP.view(*names, gap=chunk, max_len=chunk, gated=self.commit_view.gated)
+            if len(view.plan.blocks) > 1 and FRAME_ADDR is None:
+                print(f"coherent read needs {len(view.plan.blocks)} requests and FRAME_ADDR is not set; "
+                      "using settle reads")
+                view = False
+            self._coherent_view = view
+        return self._coherent_view
+
+    def read_commit(self):
+        """確定値を読む。読めなければ None。"""
+        state = {}
+        frame, consistent = None, False
+        if self.commit_view is not None:
+            t0 = time.monotonic()
+            view = False
+            if self.coherent:
+                try:
+                    view = self.coherent_view()
+                except RuntimeError as e:
+                    print(f"coherent read unavailable: {e}")
+                    return None
+            if view:
+                st, frame, consistent, reads = coherent_read(self.client, view)
+                self.last_read = {"mode": "coherent", "reads": reads, "consistent": consistent, "frame": frame}
+            else:
+                st, reads, settled = settle_read(self.client, self.commit_view,
+                                                 k=self.settle_k, max_sec=self.settle_max)
+                self.last_read = {"mode": "settle", "reads": reads, "settled": settled}
+            self.last_read["ms"] = round((time.monotonic() - t0) * 1000, 1)
+            if any(st[k] is None for k in self.commit_view.names):
+                return None
+            state.update((k, st[k]) for k in STATE_KEYS if k in st)
+        state["frame"] = frame
+        state["consistent"] = consistent
+
+        if self.scores:
+            # 同じフレームで読めた値はそのまま使う。揃っていない読みだけ、
+            # スコア単調増加フィルタ（取りこぼし対策）を通す。生の値も残す
+            if consistent or self.last_home is None or st["home"] >= self.last_home:
+                self.last_home = st["home"]
+            if consistent or self.last_away is None or st["away"] >= self.last_away:
+                self.last_away = st["away"]
+            state["home"] = int(self.last_home)
+            state["away"] = int(self.last_away)
+            state["home_raw"] = st["home"]
+            state["away_raw"] = st["away"]
+
+        # 立ち上がりを検出したときのゲート値
+        for k in ("mode1", "mode2"):
+            if k in self.gate:
+                state[k] = self.gate[k]
+        state["updated_at"] = time.time()
+        return state
+
+    def commit(self, state):
+        prev = self.state
+        self.state = state
+        for kind in diff_events(prev, state):
+            self.publish(Event(kind, dict(state), prev))
+        self.publish(Event(COMMIT, dict(state), prev))
+
+    def step(self):
+        """1回ポーリングする。次の step までの待ち時間を返す。"""
+        polled_at = time.monotonic()
+        self.gate = self.gate_view.read(self.client)
+        ready = self.ready_fn(self.gate)
+
+        gate = (self.gate.get("mode1"), self.gate.get("mode2"))
+        if gate != self.prev_gate:
+            self.prev_gate = gate
+            self.publish(Event(GATE_CHANGED, dict(self.gate)))
+
+        # F->P の立ち上がりでだけ確定値を読む（commit_delay があればその分あとで）
+        if (not self.prev_ready) and ready:
+            self.publish(Event(PITCH_READY, dict(self.state) if self.state else None))
+            self.commit_due = polled_at + self.commit_delay
+        if self.commit_due is not None and polled_at >= self.commit_due:
+            self.commit_due = None
+            state = self.read_commit()
+            if state is not None:
+                self.commit(state)
+
+        self.prev_ready = ready
+        if self.scheduler is None:
+            wait = self.poll_sec
+        else:
+            ok = None not in self.gate.values()
+            # 滞在時間は確定値の読み取りを含めず、ゲートを読んだ時刻で測る
+            wait = self.scheduler.update(ready, ok, now=polled_at)
+        if self.commit_due is not None:
+            wait = min(wait, self.commit_due - polled_at)
+        return max(0.0, wait - (time.monotonic() - polled_at))
+
+    def run(self):
+        while True:
+            time.sleep(self.step())
+
+
+class EventServer:
+    """
+    エンジンのイベントを TCP で JSON 1行ずつ配る。
+    別プロセスの購読者は remote_events() でつなぐ（エミュへのポーリングは増えない）。
+
+    送信は購読者ごとのキューと書き込みスレッドで行い、エンジンのスレッドは待たない。
+    キューが溢れた（読むのが遅い）購読者は切断する。
+    """
+
+    def __init__(self, engine, host=EVENT_HOST, port=EVENT_PORT, maxsize=CLIENT_QUEUE):
+        self.engine = engine
+        self.addr = (host, port)
+        self.maxsize = maxsize
+        self.clients = []       # [(conn, queue)]
+        self.lock = threading.Lock()
+        self.srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.srv.bind(self.addr)
+        self.srv.listen()
+        engine.subscribe(self.send)
+
+    def start(self):
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        return self
+
+    def _accept_loop(self):
+        while True:
+            conn, _ = self.srv.accept()
+            q = queue.Queue(self.maxsize)
+            # つないだ直後に最新の確定値を1回送る
+            if self.engine.state is not None:
+                q.put_nowait((Event(COMMIT, dict(self.engine.state)).to_json() + "\n").encode("utf-8"))
+            with self.lock:
+                self.clients.append((conn, q))
+            threading.Thread(target=self._writer, args=(conn, q), daemon=True).start()
+
+    def _drop(self, conn):
+        with self.lock:
+            self.clients = [(c, q) for c, q in self.clients if c is not conn]
+        try:
+            conn.close()
+        except OSError:
+            pass
+
+    def _writer(self, conn, q):
+        while True:
+            line = q.get()
+            if line is None:
+                break
+            try:
+                conn.sendall(line)
+            except OSError:
+                break
+        self._drop(conn)
+
+    def send(self, ev):
+        # エンジンのスレッドから呼ばれる。キューに積むだけで、ブロックしない
+        line = (ev.to_json() + "\n").encode("utf-8")
+        with self.lock:
+            clients = list(self.clients)
+        for conn, q in clients:
+            try:
+                q.put_nowait(line)
+            except queue.Full:
+                print("event subscriber too slow; dropped")
+                self._drop(conn)   # 書き込みスレッドは sendall の失敗で抜ける
+
+
+def remote_events(host=EVENT_HOST, port=EVENT_PORT, kinds=None):
+    """EventServer につないでイベントを順に返す（切れたら終わる。つながらなければ OSError）。"""
+    with socket.create_connection((host, port), timeout=1.0) as conn:
+        conn.settimeout(None)
+        f = conn.makefile("r", encoding="utf-8")
+        for line in f:
+            ev = Event.from_json(line)
+            if kinds is None or ev.kind in kinds:
+                yield ev
+
+
+def run_subscriber(fn, events_addr=(EVENT_HOST, EVENT_PORT), kinds=None, **engine_kw):
+    """
+    events_addr の EventServer（overlay.py など）からイベントを受けて fn に配る。
+    切れたら RECONNECT_SEC の間隔でつなぎ直し、それでもつながらなければ
+    自前でエンジンを回す（エミュを直接ポーリングする）。
+    events_addr が None なら最初から自前で回す。
+    """
+    if events_addr:
+        tries = 0
+        while tries < len(RECONNECT_SEC):
+            try:
+                for ev in remote_events(*events_addr, kinds=kinds):
+                    tries = 0
+                    fn(ev)
+                print(f"event stream {events_addr[0]}:{events_addr[1]} closed; reconnecting")
+            except OSError as e:
+                print(f"event stream {events_addr[0]}:{events_addr[1]} unavailable: {e}")
+            time.sleep(RECONNECT_SEC[tries])
+            tries += 1
+        print("falling back to local polling")
+    engine = GameEngine(**engine_kw)
+    engine.subscribe(fn, kinds)
+    engine.run()
@@ -0,0 +1,290 @@
+import json
+import math
+import os
+import sys
+import time
+from collections import Counter
+from datetime import datetime
+
+from memclient import MemClient
+from memmap import FRAME_ADDR, MEMMAP, MODE1_PITCH, MODE2_PITCH
+
+# ゲートのバイト（mode1 / mode2）と状態のバイトを間を空けずに読み続け、変化を高分解能の時刻付きで記録する。
+# 立ち上がりの前提（P: 00/14, F: 01/1A）と、立ち上がりのあと状態のバイトが落ち着くまでの時間を測り、
+# ヒストグラムにまとめる。gamestate.COMMIT_DELAY_SEC と POLL_SEC（pollsched）はこの結果から決める。
+#
+#   python gatetrace.py 300                       # 5分記録して集計（Ctrl+C で途中まで）
+#   python gatetrace.py gatetrace/xxx.json        # 記録をもう一度集計
+#
+# 時刻はその回の読み取りの要求と返事の中間（time.perf_counter）。
+# 変化の時刻の誤差は直前の読み取りとの間隔まで（その分布も一緒に出す）。
+
+HOST, PORT = "127.0.0.1", 55355
+
+TRACE_DIR = "gatetrace"
+INTERVAL_SEC = 0.0         # 読み取りの間隔（0 なら返事が来しだい次を読む）
+
+GATE_FIELDS = ("mode1", "mode2")
+STATE_FIELDS = ("balls", "strikes", "outs", "half", "on1", "on2", "on3", "home", "away")
+
+SETTLE_WINDOW_SEC = 1.0    # 立ち上がりからこの時間内（P の間）の状態の変化を「落ち着く前」とみなす
+LEAD_WINDOW_SEC = 1.0      # 立ち上がりの前この時間内の変化を「先に変わった」とみなす
+GLITCH_SEC = 0.05          # P がこれより短ければ誤検出の立ち上がりとして数える
+FRAME_SEC = 1 / 59.73      # これより速く読んでもゲームの値は変わらない
+
+BUCKETS_MS = (0, 1, 2, 5, 10, 17, 33, 50, 67, 100, 150, 200, 250, 300, 400, 500, 750, 1000, 2000, 5000)
+BAR = 40
+
+TRACE_VIEW = MEMMAP.view(*(GATE_FIELDS + STATE_FIELDS + (("frame",) if FRAME_ADDR is not None else ())),
+                         gated=False)
+
+
+def record(client, seconds, interval=INTERVAL_SEC, view=TRACE_VIEW):
+    """
+    seconds 秒（None なら Ctrl+C まで）読み続けて記録を返す。
+    transitions は [(秒, 項目, 前の値, 新しい値, 直前の読み取りからの秒, フレーム or None)]。値は生のバイト。
+    """
+    slots = [(name, bi, off) for name, (bi, off, _) in view.plan.slots.items()]
+    order = {name: i for i, name in enumerate(STATE_FIELDS + GATE_FIELDS)}
+    # 同じ読み取りで変わったものは状態を先に並べる（ゲートと同時なら「先に変わった」側に数える）
+    watched = sorted((s for s in slots if s[0] in order), key=lambda s: order[s[0]])
+    frame_slot = next((s for s in slots if s[0] == "frame"), None)
+
+    trace = {"started_at": time.time(), "fields": [s[0] for s in watched], "initial": None,
+             "samples": 0, "failures": 0, "duration": 0.0, "transitions": []}
+    transitions = trace["transitions"]
+    prev = None
+    last_t = None
+    t0 = time.perf_counter()
+    try:
+        while seconds is None or time.perf_counter() - t0 < seconds:
+            a = time.perf_counter()
+            blobs = view.plan.read_raw(client)
+            b = time.perf_counter()
+            if None in blobs:
+                trace["failures"] += 1
+                time.sleep(0.1)
+                continue
+            t = (a + b) / 2 - t0
+            vals = {name: blobs[bi][off] for name, bi, off in watched}
+            frame = blobs[frame_slot[1]][frame_slot[2]] if frame_slot else None
+            if prev is None:
+                trace["initial"] = vals
+            else:
+                for name, _, _ in watched:
+                    if vals[name] != prev[name]:
+                        transitions.append((round(t, 6), name, prev[name], vals[name], round(t - last_t, 6), frame))
+            prev = vals
+            last_t = t
+            trace["samples"] += 1
+            if interval:
+                time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+    trace["duration"] = round(time.perf_counter() - t0, 3)
+    return trace
+
+
+def is_pitch(vals):
+    return vals["mode1"] == MODE1_PITCH and vals["mode2"] == MODE2_PITCH
+
+
+def analyze(trace):
+    """
+    記録から分布を作る。戻り値の秒の list はどれも1件 = 1回ぶん。
+      gaps      読み取りの間隔（変化の時刻の誤差の上限）
+      f_dwell   F の滞在（P->F から F->P まで）
+      p_dwell   P の滞在（F->P から P->F まで）
+      skew      立ち上がりで mode1 と mode2 が変わった時刻のずれ
+      settle    立ち上がりから状態のバイトが最後に変わるまで（変わらなければ 0）
+      after     {項目: [立ち上がりのあと変わった時刻]}
+      lead      {項目: [立ち上がりの何秒前に変わっていたか]}
+    """
+    vals = dict(trace["initial"] or {})
+    out = {"gaps": [], "f_dwell": [], "p_dwell": [], "skew": [], "settle": [], "settle_frames": [],
+           "after": {k: [] for k in STATE_FIELDS}, "lead": {k: [] for k in STATE_FIELDS},
+           "edges": 0, "glitches": 0, "gate_values": Counter()}
+    if not vals:
+        return out
+    ready = is_pitch(vals)
+    last_change = {}
+    f_since = p_since = None
+    edge = None   # 今見ている立ち上がり {"t", "frame", "until", "after": {項目: 秒}, "frames": {項目: フレーム数}}
+
+    def close(e):
+        if e is not None:
+            out["settle"].append(max(e["after"].values(), default=0.0))
+            if e["frame"] is not None:
+                out["settle_frames"].append(max(e["frames"].values(), default=0))
+
+    seen_t = None
+    for t, name, old, new, gap, frame in trace["transitions"]:
+        if t != seen_t:
+            out["gaps"].append(gap)
+            seen_t = t
+        if edge is not None and t > edge["until"]:
+            close(edge)
+            edge = None
+        vals[name] = new
+        last_change[name] = t
+        if name in STATE_FIELDS:
+            if edge is not None and t > edge["t"]:
+                edge["after"][name] = t - edge["t"]
+                out["after"][name].append(t - edge["t"])
+                if frame is not None and edge["frame"] is not None:
+                    edge["frames"][name] = (frame - edge["frame"]) & 0xFF
+            continue
+
+        r = is_pitch(vals)
+        out["gate_values"][f"{vals['mode1']:02X}/{vals['mode2']:02X}"] += 1
+        if r and not ready:
+            out["edges"] += 1
+            if f_since is not None:
+                out["f_dwell"].append(t - f_since)
+            if "mode1" in last_change and "mode2" in last_change:
+                out["skew"].append(abs(last_change["mode1"] - last_change["mode2"]))
+            for k in STATE_FIELDS:
+                if k in last_change and t - last_change[k] <= LEAD_WINDOW_SEC:
+                    out["lead"][k].append(t - last_change[k])
+            close(edge)
+            edge = {"t": t, "frame": frame, "until": t + SETTLE_WINDOW_SEC, "after": {}, "frames": {}}
+            p_since = t
+        elif ready and not r:
+            if p_since is not None:
+                out["p_dwell"].append(t - p_since)
+                if t - p_since < GLITCH_SEC:
+                    out["glitches"] += 1
+            if edge is not None:
+                edge["until"] = min(edge["until"], t)
+            f_since = t
+        ready = r
+    close(edge)
+    return out
+
+
+def percentiles(xs, scale=1000.0):
+    """p50 / p90 / p99 / max（既定はミリ秒）。"""
+    if not xs:
+        return None
+    xs = sorted(xs)
+    def at(q):
+        return round(xs[min(len(xs) - 1, int(q * len(xs)))] * scale, 3)
+    return {"n": len(xs), "min": round(xs[0] * scale, 3), "p50": at(0.50), "p90": at(0.90),
+            "p99": at(0.99), "max": round(xs[-1] * scale, 3)}
+
+
+def histogram(xs, edges=BUCKETS_MS, scale=1000.0):
+    """[(下限, 上限 or None, 件数)]。値は scale 倍（ミリ秒）して edges で区切る。"""
+    counts = [0] * len(edges)
+    for x in xs:
+        v = x * scale
+        i = 0
+        while i + 1 < len(edges) and v >= edges[i + 1]:
+            i += 1
+        counts[i] += 1
+    bins = [(edges[i], edges[i + 1] if i + 1 < len(edges) else None, c) for i, c in enumerate(counts)]
+    # 両端の空のビンは出さない
+    while bins and bins[-1][2] == 0:
+        bins.pop()
+    while bins and bins[0][2] == 0:
+        bins.pop(0)
+    return bins
+
+
+def print_hist(title, xs, edges=BUCKETS_MS, scale=1000.0, unit="ms"):
+    p = percentiles(xs, scale)
+    if p is None:
+        print(f"{title}: (なし)")
+        return
+    print(f"{title}: n={p['n']} min={p['min']} p50={p['p50']} p90={p['p90']} p99={p['p99']} max={p['max']} {unit}")
+    bins = histogram(xs, edges, scale)
+    top = max(c for _, _, c in bins)
+    for lo, hi, c in bins:
+        label = f"{lo}-{hi}" if hi is not None else f"{lo}-"
+        print(f"  {label:>10} {unit} {c:6d} {'#' * max(1 if c else 0, c * BAR // top)}")
+
+
+def recommend(out):
+    """集計から COMMIT_DELAY_SEC と POLL_SEC（と pollsched.EARLY_RATIO）の目安を作る。"""
+    rec = {}
+    settle = percentiles(out["settle"], 1.0)
+    if settle:
+        # 立ち上がり後に変わる分を p99 まで待つ。読み取り間隔ぶんの誤差も足す
+        gap = percentiles(out["gaps"], 1.0)
+        delay = settle["p99"] + (gap["p99"] if gap and settle["p99"] > 0 else 0.0)
+        rec["COMMIT_DELAY_SEC"] = math.ceil(delay * 1000) / 1000
+    p = percentiles(out["p_dwell"], 1.0)
+    if p:
+        # P を丸ごと見逃さない間隔（短い P の半分）。1フレームより速くしても意味がない
+        rec["POLL_SEC_MAX"] = round(max(FRAME_SEC, p["min"] / 2), 3)
+        rec["POLL_SEC_MIN"] = round(FRAME_SEC, 3)
+    f = sorted(out["f_dwell"])
+    if len(f) >= 10:
+        # pollsched は F の滞在の下位 10% × EARLY_RATIO まで遅く読む。最短の F でもそれを越えない比
+        rec["EARLY_RATIO_MAX"] = round(f[0] / f[len(f) // 10], 2)
+    return rec
+
+
+def summarize(trace):
+    out = analyze(trace)
+    dur = trace["duration"] or 1.0
+    print(f"{trace['samples']} reads in {trace['duration']:.1f}s ({trace['samples'] / dur:.0f}/s), "
+          f"{trace['failures']} failed, {len(trace['transitions'])} transitions, "
+          f"{out['edges']} F->P edges, {out['glitches']} glitches (P < {GLITCH_SEC * 1000:.0f}ms)")
+    print("ゲートの値（変化後の mode1/mode2 とその回数）: "
+          + " ".join(f"{k}:{v}" for k, v in out["gate_values"].most_common()))
+    print_hist("変化を見た読み取りの間隔（時刻の誤差）", out["gaps"])
+    print_hist("F の滞在", out["f_dwell"])
+    print_hist("P の滞在", out["p_dwell"])
+    print_hist("mode1 と mode2 のずれ", out["skew"])
+    print_hist("立ち上がり → 状態が落ち着くまで", out["settle"])
+    if out["settle_frames"]:
+        print_hist("立ち上がり → 状態が落ち着くまで（フレーム）", out["settle_frames"],
+                   edges=tuple(range(0, 16)), scale=1.0, unit="frames")
+    print("項目ごと（after = 立ち上がりのあと変わった回数と p99、lead = 立ち上がりの前に変わっていた回数と p50）:")
+    for k in STATE_FIELDS:
+        a = percentiles(out["after"][k])
+        l = percentiles(out["lead"][k])
+        print(f"  {k:8} after {a['n'] if a else 0:4d} {a['p99'] if a else '-':>9} ms   "
+              f"lead {l['n'] if l else 0:4d} {l['p50'] if l else '-':>9} ms")
+    rec = recommend(out)
+    print("目安:")
+    for k, v in rec.items():
+        print(f"  {k} = {v}")
+    return out, rec
+
+
+def save(trace, trace_dir=TRACE_DIR):
+    os.makedirs(trace_dir, exist_ok=True)
+    name = datetime.fromtimestamp(trace["started_at"]).strftime("%Y%m%d_%H%M%S")
+    path = os.path.join(trace_dir, name + ".json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(trace, f, separators=(",", ":"))
+    return path
+
+
+def load(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main(argv):
+    arg = argv[1] if len(argv) > 1 else None
+    if arg and os.path.isfile(arg):
+        summarize(load(arg))
+        return 0
+    seconds = float(arg) if arg else None
+    client = MemClient(HOST, PORT)
+    print(f"recording gate/state bytes from {HOST}:{PORT}"
+          f"{f' for {seconds:.0f}s' if seconds else ''} (Ctrl+C to stop)")
+    trace = record(client, seconds)
+    if trace["initial"] is None:
+        print("no reads (is RetroArch running?)")
+        return 1
+    print(f"saved: {save(trace)}")
+    summarize(trace)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
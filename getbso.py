@@ -1,52 +1,30 @@
-import socket, time
+import time
 
-HOST, PORT = "127.0.0.1", 55355
-
-def read_u8(sock, addr):
-    cmd = f"READ_CORE_MEMORY {addr:04X} 1"
-    sock.sendto(cmd.encode("ascii"), (HOST, PORT))
-    data, _ = sock.recvfrom(4096)
-    text = data.decode("ascii", errors="replace").strip()
-    if " -1" in text:
-        return None, text
-    parts = text.split()
-    try:
-        v = int(parts[-1], 16)  # 最後の1バイトを拾う想定
-        return v, text
-    except Exception:
-        return None, text
+from memclient import MemClient
+from memmap import BSO_VIEW
 
-def half_to_inning_side(half):
-    # 0=1回表, 1=1回裏, 2=2回表, ...
-    if half is None:
-        return None
-    inning = (half // 2) + 1
-    side = "表" if (half % 2) == 0 else "裏"
-    return inning, side
+HOST, PORT = "127.0.0.1", 55355
 
-sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-sock.settimeout(0.25)
+client = MemClient(HOST, PORT, timeout=0.25)
 
-ADDR_BALL   = 0xC0C0
-ADDR_STR    = 0xC0C2
-ADDR_OUTS   = 0xC0C3  # ← 見つけたアウト(0-2)
-ADDR_HALF   = 0xC0C4  # ← チェンジ回数/ハーフイニング番号っぽいやつ
+# B/S/O/回のアドレスは memmap.py（C0C0/C0C2/C0C3/C0C4）
 
 while True:
-    b, rb = read_u8(sock, ADDR_BALL)
-    s, rs = read_u8(sock, ADDR_STR)
-    o, ro = read_u8(sock, ADDR_OUTS)
-    h, rh = read_u8(sock, ADDR_HALF)
+    st = BSO_VIEW.read(client)
+    b, s, o, h = st["balls"], st["strikes"], st["outs"], st["half"]
 
     if None in (b, s, o, h):
+        # RetroArch の応答（-1 の本文）やタイムアウトなど、失敗理由をそのまま出す
+        reasons = [f"{addr:04X}+{n:X}: {client.last_error(addr)}" for addr, n in BSO_VIEW.plan.blocks]
         print("read failed:",
-              f"ball={rb}",
-              f"strike={rs}",
-              f"outs(C0C3)={ro}",
-              f"half(C0C4)={rh}",
+              f"ball={b}",
+              f"strike={s}",
+              f"outs(C0C3)={o}",
+              f"half(C0C4)={h}",
+              *reasons,
               sep="\n  ")
     else:
-        inning, side = half_to_inning_side(h)
+        inning, side = st["inning"], st["side"]
         # 表示例: "3回表  B=1 S=2 O=1"
         print(f"{inning}回{side}  B={b} S={s} O={o}  (half={h})")
 
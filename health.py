@@ -0,0 +1,171 @@
+import json
+import time
+
+# エミュとのつながりと更新スレッドの様子（overlay.py / collector.py の /health と /metrics）。
+#
+#   /health   {"status": "ok" | "degraded" | "down", ...}。down のときは HTTP 503
+#   /metrics  Prometheus のテキスト形式（MemClient.stats・RTT・ロス率・更新スレッド・状態の版）
+#
+# スコアボードが止まる前に、RTT が伸びた・返事が落ち始めた、を見えるようにするためのもの。
+
+DOWN_AFTER_SEC = 5.0       # これだけ値が読めない / 更新スレッドが回らなければ down
+DEGRADED_LOSS = 0.05       # 直近の要求でこれ以上読めなければ degraded
+DEGRADED_RTT_SEC = 0.05    # RTT の p99 がこれを越えたら degraded
+
+PREFIX = "famista_"
+
+
+class UpdaterStatus:
+    """
+    更新スレッドの生存確認。1回回るごとに ok()、例外を受けたら error(e)。
+    ループ本体は例外で抜けずに、ここに残して続ける。
+    """
+
+    def __init__(self):
+        self.steps = 0
+        self.errors = 0
+        self.last_step_at = None   # 最後に回った時刻（time.time。失敗も含む）
+        self.last_error = None
+        self.last_error_at = None
+
+    def __repr__(self):
+        return f"<UpdaterStatus steps={self.steps} errors={self.errors}>"
+
+    def ok(self):
+        self.steps += 1
+        self.last_step_at = time.time()
+
+    def error(self, e):
+        self.errors += 1
+        self.last_error = repr(e)
+        self.last_error_at = self.last_step_at = time.time()
+
+
+def check(client, updater, now=None):
+    """
+    1台分の健康状態 {"status", "reasons", "emulator": MemClient.metrics(), "updater": {...}}。
+    client / updater が無い（再生中など）項目は見ない。
+    """
+    now = time.time() if now is None else now
+    reasons = []
+    status = "ok"
+
+    m = client.metrics() if client is not None else None
+    if m is not None:
+        if m["since_reply"] is None or m["since_reply"] > DOWN_AFTER_SEC:
+            status = "down"
+            reasons.append("no reply from emulator" if m["since_reply"] is None
+                           else f"no reply for {m['since_reply']:.1f}s")
+        else:
+            if m["loss"] is not None and m["loss"] >= DEGRADED_LOSS:
+                reasons.append(f"loss {m['loss'] * 100:.1f}%")
+            if m["rtt_p99"] is not None and m["rtt_p99"] > DEGRADED_RTT_SEC:
+                reasons.append(f"rtt p99 {m['rtt_p99'] * 1000:.1f}ms")
+            if reasons:
+                status = "degraded"
+
+    u = None
+    if updater is not None:
+        age = now - updater.last_step_at if updater.last_step_at else None
+        u = {"steps": updater.steps, "errors": updater.errors, "since_step": age,
+             "last_error": updater.last_error, "last_error_at": updater.last_error_at}
+        if age is None or age > DOWN_AFTER_SEC:
+            status = "down"
+            reasons.append("updater not running" if age is None else f"updater stalled for {age:.1f}s")
+        elif updater.last_error_at and now - updater.last_error_at < DOWN_AFTER_SEC and status == "ok":
+            status = "degraded"
+            reasons.append(f"updater error: {updater.last_error}")
+
+    return {"status": status, "reasons": reasons, "emulator": m, "updater": u}
+
+
+def worst(statuses):
+    for s in ("down", "degraded"):
+        if s in statuses:
+            return s
+    return "ok"
+
+
+def health_body(checks):
+    """
+    checks: {名前: check() の結果}（1台なら {"": ...}）。
+    戻り値: (HTTP コード, JSON)。どれか down なら 503。
+    """
+    if list(checks) == [""]:
+        payload = checks[""]
+    else:
+        payload = {"status": worst([c["status"] for c in checks.values()]), "games": checks}
+    code = 503 if payload["status"] == "down" else 200
+    return code, json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+
+# (名前, 型, 説明, MemClient.metrics() のキー)
+CLIENT_METRICS = (
+    ("udp_batches_total", "counter", "read_many calls", "batches"),
+    ("udp_requests_total", "counter", "READ_CORE_MEMORY datagrams sent (including retries)", "requests"),
+    ("udp_retries_total", "counter", "datagrams resent after RETRY_SEC", "retries"),
+    ("udp_replies_total", "counter", "replies carrying data", "replies"),
+    ("udp_error_replies_total", "counter", "replies with -1", "error_replies"),
+    ("udp_parse_failures_total", "counter", "replies that could not be parsed", "parse_failures"),
+    ("udp_short_replies_total", "counter", "replies shorter than requested", "short_replies"),
+    ("udp_stale_replies_total", "counter", "replies that arrived after their batch gave up", "stale_replies"),
+    ("udp_timeouts_total", "counter", "requests that got no reply after all retries", "timeouts"),
+    ("udp_loss_ratio", "gauge", "share of recent requests that returned no data", "loss"),
+    ("udp_since_reply_seconds", "gauge", "seconds since the last reply carrying data", "since_reply"),
+)
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}"
+
+
+def _num(v):
+    return "NaN" if v is None else repr(float(v)) if isinstance(v, float) else str(int(v))
+
+
+def prometheus(rows):
+    """
+    rows: [(ラベルの dict, MemClient or None, UpdaterStatus or None, GameEngine or None, Board)]
+    戻り値: Prometheus のテキスト形式（bytes）。
+    """
+    samples = {}   # 名前 -> (型, 説明, [(ラベル, 値)])
+
+    def add(name, kind, help_, labels, v):
+        samples.setdefault(name, (kind, help_, []))[2].append((labels, v))
+
+    for labels, client, updater, engine, board in rows:
+        st = check(client, updater)["status"]
+        for s in ("ok", "degraded", "down"):
+            add("health", "gauge", "1 for the current /health status", dict(labels, status=s), 1 if st == s else 0)
+        if client is not None:
+            m = client.metrics()
+            for name, kind, help_, key in CLIENT_METRICS:
+                add(name, kind, help_, labels, m[key])
+            for q, key in (("0.5", "rtt_p50"), ("0.9", "rtt_p90"), ("0.99", "rtt_p99")):
+                add("udp_rtt_seconds", "summary", "READ_CORE_MEMORY round trip over the recent window",
+                    dict(labels, quantile=q), m[key])
+            add("udp_rtt_seconds_sum", "", "", labels, m["rtt_sum"])
+            add("udp_rtt_seconds_count", "", "", labels, m["replies"])
+        if updater is not None:
+            add("updater_steps_total", "counter", "polling steps completed", labels, updater.steps)
+            add("updater_errors_total", "counter", "polling steps that raised", labels, updater.errors)
+            add("updater_since_step_seconds", "gauge", "seconds since the last polling step", labels,
+                time.time() - updater.last_step_at if updater.last_step_at else None)
+        if engine is not None and engine.scheduler is not None:
+            s = engine.scheduler.stats()
+            add("poll_interval_seconds", "gauge", "current polling interval", labels, s["interval_sec"])
+            add("pitch_edges_total", "counter", "F->P edges seen", labels, s["edges"])
+            add("missed_edges_total", "counter", "edges caught at a slower interval than POLL_SEC",
+                labels, s["missed_edges"])
+        add("state_version", "gauge", "published state version", labels, board.version)
+
+    lines = []
+    for name, (kind, help_, values) in samples.items():
+        if kind:
+            lines.append(f"# HELP {PREFIX}{name} {help_}")
+            lines.append(f"# TYPE {PREFIX}{name} {kind}")
+        for labels, v in values:
+            lines.append(f"{PREFIX}{name}{_labels(labels)} {_num(v)}")
+    return ("\n".join(lines) + "\n").encode("utf-8")
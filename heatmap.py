@@ -0,0 +1,202 @@
+import os
+import re
+import struct
+import sys
+import threading
+import time
+import zlib
+from array import array
+
+from memclient import MemClient
+from memmap import WRAM_BASE, WRAM_SIZE
+from wramcap import dump_wram
+
+# WRAM を一定間隔で読み続けて、バイトごとに
+#   変化した回数 / 出てきた値の種類数 / 最後に変わった時刻
+# を数える。タイマのようにずっと動いているバイトを、アドレス探索の前に除外するのに使う。
+#
+#   python heatmap.py 600      # 10分間プロファイル（Ctrl+C で途中保存して終了）
+#
+# 保存ファイルは前回の続きから数え足す（やり直すときはファイルを消す）。
+
+HOST, PORT = "127.0.0.1", 55355
+
+HEATMAP_PATH = "score_snaps/heatmap.bin"
+INTERVAL_SEC = 0.1
+SAVE_SEC = 30            # プロファイル中もこの間隔で保存する
+
+VOLATILE_RATE = 0.5      # 読み取りの半分以上で変わっているバイトは「ノイズ」
+VOLATILE_DISTINCT = 64   # 値の種類がこれを超えるバイトも「ノイズ」
+
+MAGIC = b"FHEATv1\n"
+HEAD = struct.Struct("<HHIdd")   # base, size, samples, 最初の時刻, 最後の時刻
+
+_NONZERO = re.compile(rb"[^\x00]")
+_POPCOUNT = bytes(bin(i).count("1") for i in range(256))
+
+
+class Heatmap:
+    """バイトごとの変化回数・値の種類・最後に変わった時刻。"""
+
+    def __init__(self, base=WRAM_BASE, size=WRAM_SIZE):
+        self.base = base
+        self.size = size
+        self.samples = 0
+        self.first_ts = None
+        self.last_ts = None
+        self.changes = array("I", bytes(4 * size))
+        self.last_change = array("d", bytes(8 * size))
+        self.seen = bytearray(32 * size)   # バイトごとに 256bit の「出てきた値」集合
+        self._prev = None
+
+    def __repr__(self):
+        return f"<Heatmap {self.base:04X}+{self.size:X} samples={self.samples}>"
+
+    def _mark(self, pos, v):
+        self.seen[pos * 32 + (v >> 3)] |= 1 << (v & 7)
+
+    def add(self, data, ts=None):
+        """1回分の読み取りを数える。"""
+        ts = time.time() if ts is None else ts
+        if self._prev is None:
+            for pos, v in enumerate(data):
+                self._mark(pos, v)
+            self.first_ts = self.first_ts or ts
+        else:
+            x = int.from_bytes(self._prev, "big") ^ int.from_bytes(data, "big")
+            if x:
+                for m in _NONZERO.finditer(x.to_bytes(self.size, "big")):
+                    pos = m.start()
+                    self.changes[pos] += 1
+                    self.last_change[pos] = ts
+                    self._mark(pos, data[pos])
+        self._prev = data
+        self.samples += 1
+        self.last_ts = ts
+
+    def distinct(self):
+        seen = self.seen.translate(_POPCOUNT)
+        return [sum(seen[p * 32:p * 32 + 32]) for p in range(self.size)]
+
+    def rate(self):
+        """バイトごとの「読み取り1回あたりの変化率」（0..1）。"""
+        n = max(1, self.samples - 1)
+        return [c / n for c in self.changes]
+
+    def volatile_mask(self, rate=VOLATILE_RATE, distinct=VOLATILE_DISTINCT):
+        """ノイズ扱いのバイトが 1 の bytes（長さ size）。"""
+        rates = self.rate()
+        kinds = self.distinct()
+        return bytes(1 if r > rate or k > distinct else 0 for r, k in zip(rates, kinds))
+
+    def top(self, n=20):
+        """変化の多い順に [(addr, 変化回数, 種類数)]。"""
+        kinds = self.distinct()
+        order = sorted(range(self.size), key=lambda p: -self.changes[p])[:n]
+        return [(self.base + p, self.changes[p], kinds[p]) for p in order if self.changes[p]]
+
+    # ====== 保存 / 読み込み ======
+
+    def save(self, path=HEATMAP_PATH):
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        body = (HEAD.pack(self.base, self.size, self.samples, self.first_ts or 0.0, self.last_ts or 0.0)
+                + self.changes.tobytes() + self.last_change.tobytes() + bytes(self.seen))
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(MAGIC)
+            f.write(zlib.compress(body, 6))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path=HEATMAP_PATH):
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"not a heatmap file: {path}")
+            body = zlib.decompress(f.read())
+        base, size, samples, first_ts, last_ts = HEAD.unpack_from(body)
+        hm = cls(base, size)
+        hm.samples = samples
+        hm.first_ts = first_ts or None
+        hm.last_ts = last_ts or None
+        pos = HEAD.size
+        hm.changes = array("I", body[pos:pos + 4 * size])
+        pos += 4 * size
+        hm.last_change = array("d", body[pos:pos + 8 * size])
+        pos += 8 * size
+        hm.seen = bytearray(body[pos:pos + 32 * size])
+        return hm
+
+
+def load_volatile_mask(path=HEATMAP_PATH, rate=VOLATILE_RATE, distinct=VOLATILE_DISTINCT):
+    """探索ツール用。ヒートマップが無ければ None。"""
+    if not os.path.exists(path):
+        return None
+    return Heatmap.load(path).volatile_mask(rate, distinct)
+
+
+class HeatmapProfiler:
+    """別スレッドで WRAM を読み続けて Heatmap に数える。"""
+
+    def __init__(self, client, heatmap=None, interval=INTERVAL_SEC, path=HEATMAP_PATH, save_sec=SAVE_SEC):
+        self.client = client
+        self.heatmap = heatmap or Heatmap()
+        self.interval = interval
+        self.path = path
+        self.save_sec = save_sec
+        self.failures = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _loop(self):
+        hm = self.heatmap
+        saved = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                data = dump_wram(self.client, hm.base, hm.size)
+            except RuntimeError:
+                self.failures += 1
+                self._stop.wait(0.5)
+                continue
+            hm.add(data)
+            if self.path and time.monotonic() - saved >= self.save_sec:
+                hm.save(self.path)
+                saved = time.monotonic()
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        if self.path:
+            self.heatmap.save(self.path)
+
+
+def main(argv):
+    seconds = float(argv[1]) if len(argv) > 1 else None
+    hm = Heatmap.load(HEATMAP_PATH) if os.path.exists(HEATMAP_PATH) else Heatmap()
+    prof = HeatmapProfiler(MemClient(HOST, PORT), hm).start()
+    print(f"profiling WRAM every {INTERVAL_SEC}s -> {HEATMAP_PATH} (continuing from {hm.samples} samples). Ctrl+C to stop.")
+    t0 = time.monotonic()
+    try:
+        while seconds is None or time.monotonic() - t0 < seconds:
+            time.sleep(1.0)
+    except KeyboardInterrupt:
+        pass
+    prof.stop()
+
+    mask = hm.volatile_mask()
+    print(f"\n{hm}  read failures={prof.failures}  volatile bytes={mask.count(1)}/{hm.size}")
+    for addr, n, kinds in hm.top():
+        print(f"  {addr:04X}: {n} changes, {kinds} distinct values")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
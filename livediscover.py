@@ -0,0 +1,112 @@
+import sys
+import time
+
+import corpus as corpus_mod
+from discover import DERIVED_TARGETS, IncrementalLoo, target_values
+from heatmap import load_volatile_mask
+from memclient import MemClient
+from memmap import WRAM_BASE, WRAM_SIZE
+from snapstore import DEFAULT_PATH, SnapStore
+from wramcap import CAP_READS, capture
+
+# ラベルを付けながら WRAM を取り、取るたびに全アドレスの 1つ抜き正解率を更新して上位を表示する。
+# old/bbkkk.py の対話版（done まで待たずに、当たりが見えたらその場でやめられる）。
+#
+#   python livediscover.py bases        # 1B2B3B（例 101）で入力
+#   python livediscover.py stamina      # 数値で入力（10進 / 0x16進）
+#
+# 取ったものは ARCHIVE にラベル付きで追記するので、あとで discover.py でも見直せる。
+
+HOST, PORT = "127.0.0.1", 55355
+
+ARCHIVE = DEFAULT_PATH
+SEED_FROM_ARCHIVE = True   # 起動時にアーカイブ内の同じラベル付きサンプルを先に読み込む
+TOP_N = 15
+
+
+def parse_label(key, s):
+    """入力文字列をラベル値に。bases / on1..3 は 1B2B3B の3桁、それ以外は整数。"""
+    s = s.strip().lower()
+    if key == "bases" or key in ("on1", "on2", "on3"):
+        if len(s) != 3 or any(c not in "01" for c in s):
+            raise ValueError("use 3 bits: 1B2B3B, e.g. 101")
+        # on1..3 も塁マスクとして保存し、学習側で該当ビットを取り出す
+        return "bases", int(s[0]) | (int(s[1]) << 1) | (int(s[2]) << 2)
+    return key, int(s, 0)
+
+
+def print_board(inc, top_n=TOP_N, exclude=None):
+    board = inc.leaderboard(top_n, exclude)
+    labels = " ".join(f"{k}:{v}" for k, v in sorted(inc.global_counts.items(), key=lambda x: str(x[0])))
+    print(f"--- n={inc.n}  labels {labels}")
+    for score, addr, acc, uniq in board:
+        print(f"score={score:.3f}  loocv={acc * 100:5.1f}%  addr={addr:04X}  uniq={uniq:3d}")
+    if len(board) >= 2 and board[0][2] == 1.0 and board[1][0] < board[0][0]:
+        print(f"=> {board[0][1]:04X} だけが全問正解")
+
+
+def main(argv):
+    if len(argv) < 2:
+        print("usage: python livediscover.py LABEL")
+        return 2
+    key = argv[1]
+    derive = DERIVED_TARGETS.get(key)
+
+    def learn_value(labels):
+        return derive(labels) if derive else labels.get(key)
+
+    store = SnapStore(ARCHIVE)
+    inc = IncrementalLoo(WRAM_SIZE, WRAM_BASE)
+    # heatmap.py で取ったノイズ（タイマなど）のバイトは順位に出さない
+    volatile = load_volatile_mask()
+    if volatile is not None:
+        print(f"excluding {volatile.count(1)} volatile bytes (heatmap)")
+
+    if SEED_FROM_ARCHIVE and len(store):
+        c = corpus_mod.load((ARCHIVE,))
+        ys = target_values(c, key)
+        for i, y in enumerate(ys):
+            if y is not None:
+                inc.add(bytes(c.row(i)), y)
+        c.close()
+        print(f"seeded {inc.n} labeled samples from {ARCHIVE}")
+        if inc.n:
+            print_board(inc, exclude=volatile)
+
+    client = MemClient(HOST, PORT, timeout=0.9)
+    history = []   # (snap, 学習に使った値, Entry)
+    print("Enter label (blank line = skip, u = undo, done = quit).\n")
+    while True:
+        s = input(f"{key}> ").strip()
+        if not s:
+            continue
+        if s.lower() in ("done", "quit", "exit", "q"):
+            break
+        if s.lower() == "u":
+            if history:
+                snap, y, e = history.pop()
+                inc.remove(snap, y)
+                print(f"undo #{e.i} (archive keeps it; label={e.labels})")
+                print_board(inc, exclude=volatile)
+            continue
+        try:
+            name, value = parse_label(key, s)
+        except ValueError as e:
+            print("invalid:", e)
+            continue
+
+        print("capturing...")
+        t0 = time.perf_counter()
+        snap, mask = capture(client, reads=CAP_READS)
+        labels = {name: value, "note": f"livediscover {key}"}
+        e = store.append(snap, labels, mask=mask)
+        y = learn_value(labels)
+        inc.add(snap, y)
+        history.append((snap, y, e))
+        print(f"captured #{e.i} ({(time.perf_counter() - t0) * 1000:.0f} ms, unstable {mask.count(1)})")
+        print_board(inc, exclude=volatile)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
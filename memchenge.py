@@ -1,49 +1,50 @@
-import socket, time
+import time
+
+from memclient import MemClient
+from memwatch import MemWatcher
 
 HOST, PORT = "127.0.0.1", 55355
-BASE = 0xC0B0
-SIZE = 0x40  # 64 bytesくらい見ておく
-
-def read_block(sock, addr, nbytes):
-    cmd = f"READ_CORE_MEMORY {addr:04X} {nbytes}"
-    sock.sendto(cmd.encode("ascii"), (HOST, PORT))
-    data, _ = sock.recvfrom(65535)
-    text = data.decode("ascii", errors="replace").strip()
-    if " -1" in text:
-        return None, text
-    parts = text.split()
-    hexbytes = parts[-nbytes:]
-    try:
-        return bytes(int(x, 16) for x in hexbytes), text
-    except:
-        return None, text
-
-sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-sock.settimeout(0.5)
-
-prev = None
+
+# 見る範囲（開始アドレス, バイト数）。WRAM 全体 (0xC000, 0x2000) でもよい
+REGIONS = (
+    (0xC0B0, 0x40),  # 64 bytesくらい見ておく
+)
+INTERVAL_SEC = 0.1
+HISTORY = 512        # 覚えておくフレーム数
+
+# 終了時（Ctrl+C）に「このアドレスが 1 増えたときに一緒に変わったバイト」を出す
+TRIGGER_ADDR = 0xC0C3   # Out
+TRIGGER_TOP = 20
+
+client = MemClient(HOST, PORT)
+watcher = MemWatcher(client, REGIONS, history=HISTORY)
+
 print("Watch bytes... Make an OUT and see what changes. Ctrl+C to stop.")
-while True:
-    blob, raw = read_block(sock, BASE, SIZE)
-    if blob is None:
-        print("read failed:", raw)
-        time.sleep(0.5)
-        continue
-
-    if prev is None:
-        prev = blob
-
-    # 差分だけ出す
-    diffs = []
-    for i, (a, b) in enumerate(zip(prev, blob)):
-        if a != b:
-            diffs.append((BASE + i, a, b))
-
-    if diffs:
-        print("CHANGED:")
-        for addr, old, new in diffs:
-            print(f"  {addr:04X}: {old:02X} -> {new:02X} ({old} -> {new})")
-        print("-" * 40)
-
-    prev = blob
-    time.sleep(0.1)
+try:
+    while True:
+        diffs = watcher.poll()
+        if diffs is None:
+            for addr, err in watcher.failed_at():
+                print(f"read failed at {addr:04X}: {err}")
+            time.sleep(0.5)
+            continue
+
+        # 差分だけ出す
+        if diffs:
+            print("CHANGED:")
+            for addr, old, new in diffs:
+                print(f"  {addr:04X}: {old:02X} -> {new:02X} ({old} -> {new})")
+            print("-" * 40)
+
+        time.sleep(INTERVAL_SEC)
+except KeyboardInterrupt:
+    pass
+
+try:
+    trig, ranked = watcher.coincident(TRIGGER_ADDR, lambda old, new: new == old + 1)
+except KeyError:
+    trig, ranked = 0, []
+print(f"\n{TRIGGER_ADDR:04X} +1: {trig} times in the last {len(watcher.frames)} frames")
+for addr, k, total in ranked[:TRIGGER_TOP]:
+    mark = "  <= exactly then" if k == trig == total else ""
+    print(f"  {addr:04X}: changed with it {k}/{trig}, {total} changes in total{mark}")
@@ -0,0 +1,238 @@
+import socket, time, select, threading
+from collections import deque
+
+HOST, PORT = "127.0.0.1", 55355  # RetroArch UDP
+
+# ====== 送受信設定 ======
+TIMEOUT_SEC = 0.5    # 1バッチ全体の締め切り
+RETRY_SEC = 0.08     # 返事が来なければこの間隔で再送
+RETRIES = 3          # 再送回数の上限
+WINDOW = 32          # 同時に投げておく要求数
+
+# ====== 計測 ======
+RTT_WINDOW = 512     # RTT とロス率を見る直近の要求数
+
+
+def parse_reply(text):
+    """
+    "READ_CORE_MEMORY c0d3 00 01 ..." を (addr, bytes, error) に分解する。
+    失敗応答（-1）や16進として読めない応答は (addr, None, 応答テキスト)。
+    アドレスすら取れないものは None を返す。
+    """
+    parts = text.split()
+    if len(parts) < 3 or parts[0] != "READ_CORE_MEMORY":
+        return None
+    try:
+        addr = int(parts[1], 16)
+    except ValueError:
+        return None
+    if parts[2] == "-1":
+        return addr, None, text
+    try:
+        return addr, bytes(int(x, 16) for x in parts[2:]), None
+    except ValueError:
+        return addr, None, f"parse error: {text}"
+
+
+class MemClient:
+    """
+    READ_CORE_MEMORY をまとめて投げるクライアント。
+
+    要求は WINDOW 個まで同時に送っておき、返ってきたアドレスで突き合わせる。
+    届かなかったものは RETRY_SEC ごとに再送する。
+    読めなかった理由は errors[addr]（"timeout" / 応答テキスト）に残る。
+    送受信の回数は stats、直近 RTT_WINDOW 件の RTT と成否は metrics() で見られる（/metrics・/health 用）。
+
+    ソケットを1つ共有するので、read_many はロックで1バッチずつ直列にする。
+    スレッドごとに並行して読みたいならスレッドごとに MemClient を作ること。
+    """
+
+    def __init__(self, host=HOST, port=PORT, timeout=TIMEOUT_SEC,
+                 retry_sec=RETRY_SEC, retries=RETRIES, window=WINDOW):
+        if window < 1:
+            raise ValueError(f"window must be >= 1: {window}")
+        self.addr = (host, port)
+        self.timeout = timeout
+        self.retry_sec = retry_sec
+        self.retries = retries
+        self.window = window
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        self.lock = threading.Lock()
+        self.errors = {}   # addr -> 直近の失敗理由
+        self.bad_reply = None
+
+        self.stats = {
+            "batches": 0,         # read_many の回数
+            "requests": 0,        # 送った要求（再送を含む）
+            "retries": 0,         # そのうち再送
+            "replies": 0,         # 値が読めた返事
+            "error_replies": 0,   # -1 の返事
+            "parse_failures": 0,  # 読めない返事（アドレス不明・16進でない）
+            "short_replies": 0,   # 頼んだより短い返事
+            "stale_replies": 0,   # もう待っていない（遅れて来た）返事
+            "timeouts": 0,        # 再送しても返事が無かった要求
+            "rtt_sum": 0.0,       # replies の RTT の合計（秒）
+        }
+        self.rtts = deque(maxlen=RTT_WINDOW)       # 直近の RTT（秒）
+        self.outcomes = deque(maxlen=RTT_WINDOW)   # 直近の要求の成否（1 / 0）
+        self.last_reply_at = None   # 最後に値が読めた時刻（time.time）
+
+    def close(self):
+        self.sock.close()
+
+    def _send(self, addr, n):
+        cmd = f"READ_CORE_MEMORY {addr:04X} {n}"
+        self.sock.sendto(cmd.encode("ascii"), self.addr)
+        self.stats["requests"] += 1
+
+    def _drain(self):
+        # 前のバッチの遅れて来た返事を捨てる（同じアドレスに誤爆させない）
+        while True:
+            try:
+                self.sock.recvfrom(65535)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return
+            self.stats["stale_replies"] += 1
+
+    def last_error(self, addr):
+        """addr の直近の読み取りが失敗した理由。成功していれば None。"""
+        return self.errors.get(addr)
+
+    def metrics(self):
+        """
+        stats に直近 RTT_WINDOW 件の集計を足した dict。
+        rtt_p50 / rtt_p90 / rtt_p99 / rtt_max（秒。再送した要求は最後に送ってからの時間）、
+        loss（値が読めなかった割合）、since_reply（最後に読めてからの秒）。
+        """
+        out = dict(self.stats)
+        rtts = sorted(self.rtts)
+        for q, key in ((0.50, "rtt_p50"), (0.90, "rtt_p90"), (0.99, "rtt_p99")):
+            out[key] = rtts[min(len(rtts) - 1, int(q * len(rtts)))] if rtts else None
+        out["rtt_max"] = rtts[-1] if rtts else None
+        outcomes = list(self.outcomes)
+        out["window"] = len(outcomes)
+        out["loss"] = 1.0 - sum(outcomes) / len(outcomes) if outcomes else None
+        out["since_reply"] = time.time() - self.last_reply_at if self.last_reply_at else None
+        return out
+
+    def read_many(self, reqs, timeout=None):
+        """
+        reqs: [(addr, nbytes), ...]
+        戻り値: 同じ順番の [bytes or None, ...]
+        同じアドレスが複数あれば長い方を1回だけ読んで切り出す。
+        """
+        with self.lock:
+            self.stats["batches"] += 1
+            return self._read_many(reqs, timeout)
+
+    def _read_many(self, reqs, timeout):
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+
+        want = {}
+        for addr, n in reqs:
+            want[addr] = max(n, want.get(addr, 0))
+        for addr in want:
+            self.errors.pop(addr, None)
+
+        got = {}
+        queue = deque(want.items())
+        inflight = {}  # addr -> [nbytes, sent_at, tries]
+
+        self._drain()
+        while queue or inflight:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+
+            while queue and len(inflight) < self.window:
+                addr, n = queue.popleft()
+                self._send(addr, n)
+                inflight[addr] = [n, now, 1]
+
+            due = min(sent + self.retry_sec for _, sent, _ in inflight.values())
+            wait = max(0.0, min(due, deadline) - now)
+            r, _, _ = select.select([self.sock], [], [], wait)
+            if r:
+                while True:
+                    try:
+                        data, _ = self.sock.recvfrom(65535)
+                    except (BlockingIOError, InterruptedError):
+                        break
+                    except OSError:
+                        # Windows では相手不在で ConnectionResetError が来る
+                        break
+                    parsed = parse_reply(data.decode("ascii", errors="replace").strip())
+                    if parsed is None:
+                        # どのアドレス宛てか分からない応答は最後の1件だけ覚えておく
+                        self.bad_reply = data[:200]
+                        self.stats["parse_failures"] += 1
+                        continue
+                    addr, blob, err = parsed
+                    slot = inflight.get(addr)
+                    if slot is None:
+                        self.stats["stale_replies"] += 1
+                        continue
+                    if blob is not None and len(blob) < slot[0]:
+                        # 短い応答は再送で取り直す（最後まで揃わなければ理由として残す）
+                        self.errors[addr] = f"short reply ({len(blob)}/{slot[0]} bytes)"
+                        self.stats["short_replies"] += 1
+                        continue
+                    got[addr] = blob[:slot[0]] if blob is not None else None
+                    if err is None:
+                        self.errors.pop(addr, None)
+                        rtt = time.monotonic() - slot[1]
+                        self.stats["replies"] += 1
+                        self.stats["rtt_sum"] += rtt
+                        self.rtts.append(rtt)
+                        self.outcomes.append(1)
+                        self.last_reply_at = time.time()
+                    else:
+                        self.errors[addr] = err
+                        self.stats["parse_failures" if err.startswith("parse error") else "error_replies"] += 1
+                        self.outcomes.append(0)
+                    del inflight[addr]
+
+            now = time.monotonic()
+            for addr, slot in list(inflight.items()):
+                n, sent, tries = slot
+                if now - sent < self.retry_sec:
+                    continue
+                if tries > self.retries:
+                    self.errors.setdefault(addr, "timeout")
+                    self.stats["timeouts"] += 1
+                    self.outcomes.append(0)
+                    del inflight[addr]
+                    continue
+                self._send(addr, n)
+                self.stats["retries"] += 1
+                slot[1] = now
+                slot[2] = tries + 1
+
+        for addr in inflight:
+            self.errors.setdefault(addr, "timeout")
+            self.stats["timeouts"] += 1
+            self.outcomes.append(0)
+        # 締め切りで送れなかった要求も読めなかった数に入れる
+        for addr, _ in queue:
+            self.errors.setdefault(addr, "timeout")
+            self.stats["timeouts"] += 1
+            self.outcomes.append(0)
+
+        out = []
+        for addr, n in reqs:
+            blob = got.get(addr)
+            out.append(blob[:n] if blob is not None else None)
+        return out
+
+    def read_block(self, addr, nbytes):
+        return self.read_many([(addr, nbytes)])[0]
+
+    def read_u8(self, addr):
+        b = self.read_block(addr, 1)
+        return b[0] if b else None
+
+    def read_u8_many(self, addrs):
+        return [b[0] if b else None for b in self.read_many([(a, 1) for a in addrs])]
@@ -0,0 +1,268 @@
+import time
+from collections import Counter
+
+from readplan import plan_reads, MAX_GAP, MAX_LEN
+
+# ファミスタGB のメモリマップ（README の「主要メモリアドレス」の実体）。
+# アドレスやデコードを変えるときはここだけ直せば全スクリプトに反映される。
+
+WRAM_BASE = 0xC000
+WRAM_SIZE = 0x2000
+
+# 立ち上がり後の確定読み（coherent_read）。全項目を同じフレームの値として読む
+FRAME_ADDR = None     # フレームごとに進むカウンタ（分かれば。heatmap.py で変化率 ~1.0・種類 256 のバイトが候補）
+COHERENT_RETRIES = 4  # 前後に挟んだフレームカウンタがずれていたら読み直す回数
+
+# coherent_read が使えないとき（1要求に収まらず FRAME_ADDR も無い）の確定読み（settle_read）
+SETTLE_K = 3          # 何回続けて同じなら確定とするか
+SETTLE_MAX_SEC = 0.5  # これで揃わなければ一番多かった読み取りを使う
+
+# 投球可能ゲートの P 側の値
+MODE1_PITCH = 0x00
+MODE2_PITCH = 0x14
+
+
+def u8(v):
+    return v
+
+def occupied(v):
+    # 塁は 0/非0 で判定
+    return v != 0
+
+def half_to_inning_side(half):
+    # 0=1回表, 1=1回裏, 2=2回表...
+    inning = (half // 2) + 1
+    side = "表" if (half % 2) == 0 else "裏"
+    return inning, side
+
+
+class Field:
+    """
+    1つのメモリ項目。
+
+    decode: 生の値（幅1なら int、それ以外は bytes）→ 表示用の値
+    valid:  生の値の妥当性チェック（False なら None 扱い）
+    gate:   この名前の値が真のときだけ意味を持つ（例: 塁は投球可能中のみ）。
+            view(..., gated=False) では見ない（立ち上がりで既にゲートを確認済みの読み取り用）
+    """
+
+    def __init__(self, name, addr, width=1, decode=u8, valid=None, gate=None, note=""):
+        self.name = name
+        self.addr = addr
+        self.width = width
+        self.decode = decode
+        self.valid = valid
+        self.gate = gate
+        self.note = note
+
+
+class Derived:
+    """複数の項目から計算する値（ready, inning, side など）。"""
+
+    def __init__(self, name, deps, fn, note=""):
+        self.name = name
+        self.deps = deps
+        self.fn = fn
+        self.note = note
+
+
+FIELDS = (
+    Field("mode1", 0xC0D3, note="投球可能ゲート1（P: 00 / F: 01）"),
+    Field("mode2", 0xC0CE, note="投球可能ゲート2（P: 14 / F: 1A）"),
+    Field("balls", 0xC0C0, note="Ball"),
+    Field("strikes", 0xC0C2, note="Strike"),
+    Field("outs", 0xC0C3, note="Out"),
+    Field("half", 0xC0C4, note="Half（回の進行）"),
+    Field("on1", 0xD262, decode=occupied, gate="ready", note="1塁"),
+    Field("on2", 0xD282, decode=occupied, gate="ready", note="2塁"),
+    Field("on3", 0xD2A2, decode=occupied, gate="ready", note="3塁"),
+    Field("home", 0xD81F, note="HOME スコア"),
+    Field("away", 0xD83F, note="AWAY スコア"),
+) + ((Field("frame", FRAME_ADDR, note="フレームカウンタ"),) if FRAME_ADDR is not None else ())
+
+DERIVED = (
+    Derived("ready", ("mode1", "mode2"),
+            lambda m1, m2: m1 == MODE1_PITCH and m2 == MODE2_PITCH,
+            note="投球可能（C0D3==00 かつ C0CE==14）"),
+    Derived("inning", ("half",), lambda h: half_to_inning_side(h)[0]),
+    Derived("side", ("half",), lambda h: half_to_inning_side(h)[1]),
+)
+
+
+class MapView:
+    """
+    必要な項目だけを読む、コンパイル済みの読み取り計画＋デコーダ。
+    毎ポーリングの処理はテーブルを舐めて切り出すだけ。
+    """
+
+    def __init__(self, mm, names, gap=MAX_GAP, max_len=MAX_LEN, gated=True):
+        # 派生値と gate の依存を辿って、実際に読む項目を決める
+        need = []
+        derived = []
+        todo = list(names)
+        while todo:
+            name = todo.pop(0)
+            if name in need or any(d.name == name for d in derived):
+                continue
+            if name in mm.fields:
+                need.append(name)
+                if gated and mm.fields[name].gate:
+                    todo.append(mm.fields[name].gate)
+            elif name in mm.derived:
+                derived.append(mm.derived[name])
+                todo.extend(mm.derived[name].deps)
+            else:
+                raise KeyError(f"unknown field: {name}")
+
+        fields = [mm.fields[n] for n in need]
+        self.names = tuple(names)
+        self.gated = gated
+        self.plan = plan_reads({f.name: (f.addr, f.width) for f in fields}, gap=gap, max_len=max_len)
+
+        # (name, block_index, offset, width, decode, valid)
+        self._table = []
+        for f in fields:
+            bi, off, width = self.plan.slots[f.name]
+            self._table.append((f.name, bi, off, width, f.decode, f.valid))
+        # 派生値は依存が先に計算されるよう、定義順に並べる
+        self._derived = [(d.name, d.deps, d.fn) for d in mm.derived.values() if d in derived]
+        self._gated = [(f.name, f.gate) for f in fields if gated and f.gate]
+
+    def __repr__(self):
+        return f"<MapView {' '.join(self.names)} {self.plan!r}>"
+
+    def _finish(self, raw):
+        out = {}
+        for name, _, _, _, decode, valid in self._table:
+            v = raw[name]
+            if v is not None and valid is not None and not valid(v):
+                v = None
+            out[name] = decode(v) if v is not None else None
+        for name, deps, fn in self._derived:
+            args = [out[d] for d in deps]
+            out[name] = fn(*args) if None not in args else None
+        for name, gate in self._gated:
+            if not out[gate]:
+                out[name] = None
+        return out
+
+    def decode(self, blobs):
+        """plan.read_raw() の結果をデコードする。"""
+        raw = {}
+        for name, bi, off, width, _, _ in self._table:
+            blob = blobs[bi]
+            if blob is None:
+                raw[name] = None
+            elif width == 1:
+                raw[name] = blob[off]
+            else:
+                raw[name] = blob[off:off + width]
+        return self._finish(raw)
+
+    def decode_wram(self, wram, base=WRAM_BASE):
+        """保存済みの WRAM ダンプから同じ項目を取り出す。"""
+        blobs = [wram[a - base:a - base + n] for a, n in self.plan.blocks]
+        return self.decode(blobs)
+
+    def read(self, client):
+        return self.decode(self.plan.read_raw(client))
+
+
+def stable_read(client, view, n=9, gap=0.01):
+    # view をまとめて n 回読み、項目ごとに最頻値を取る
+    counters = {}
+    for _ in range(n):
+        for name, v in view.read(client).items():
+            if v is not None:
+                counters.setdefault(name, Counter())[v] += 1
+        time.sleep(gap)
+    out = {name: None for name in view.names}
+    for name, c in counters.items():
+        out[name] = c.most_common(1)[0][0]
+    return out
+
+
+def settle_read(client, view, k=SETTLE_K, max_sec=SETTLE_MAX_SEC):
+    """
+    view を間を空けずに読み直し、k 回続けて生データが一致したところで確定する。
+    max_sec までに揃わなければ、それまでで一番多かった読み取りを使う。
+    戻り値: (値の dict, 読んだ回数, 揃ったか)
+    """
+    deadline = time.monotonic() + max_sec
+    seen = Counter()
+    last = None
+    run = 0
+    reads = 0
+    while True:
+        blobs = tuple(view.plan.read_raw(client))
+        reads += 1
+        if None in blobs:
+            last, run = None, 0
+        else:
+            seen[blobs] += 1
+            run = run + 1 if blobs == last else 1
+            last = blobs
+            if run >= k:
+                return view.decode(blobs), reads, True
+        if time.monotonic() >= deadline:
+            break
+    if seen:
+        blobs = seen.most_common(1)[0][0]
+    return view.decode(blobs), reads, False
+
+
+def coherent_read(client, view, frame_addr=FRAME_ADDR, retries=COHERENT_RETRIES):
+    """
+    view の全項目を同じフレームの値として読む。
+    view.plan が1ブロックなら1要求で読む（RetroArch はフレームの合間に1要求ずつ答えるので、それだけで揃う）。
+    複数ブロックなら frame_addr を読んでからブロックを読み、もう一度 frame_addr を読む。
+    前後で違えば（途中でフレームが進んだ）retries 回まで読み直す。
+    戻り値: (値の dict, フレーム番号 or None, 同じフレームか, 読んだ回数)
+    """
+    blocks = view.plan.blocks
+    if len(blocks) == 1:
+        blobs = view.plan.read_raw(client)
+        st = view.decode(blobs)
+        return st, st.get("frame"), blobs[0] is not None, 1
+    if frame_addr is None:
+        raise ValueError(f"{view!r} needs {len(blocks)} reads and FRAME_ADDR is not set")
+
+    reads = 0
+    while True:
+        got = client.read_many([(frame_addr, 1)] + blocks)
+        after = client.read_u8(frame_addr)
+        reads += 1
+        blobs = got[1:]
+        before = got[0][0] if got[0] else None
+        if None in blobs or before is None or after is None:
+            return view.decode(blobs), None, False, reads
+        if before == after:
+            return view.decode(blobs), before, True, reads
+        if reads > retries:
+            return view.decode(blobs), after, False, reads
+
+
+class MemoryMap:
+    def __init__(self, fields, derived):
+        self.fields = {f.name: f for f in fields}
+        self.derived = {d.name: d for d in derived}
+
+    def addr(self, name):
+        return self.fields[name].addr
+
+    def view(self, *names, gap=MAX_GAP, max_len=MAX_LEN, gated=True):
+        return MapView(self, names, gap=gap, max_len=max_len, gated=gated)
+
+
+MEMMAP = MemoryMap(FIELDS, DERIVED)
+
+# よく使う組み合わせ（起動時に1回だけコンパイル）
+GATE_VIEW = MEMMAP.view("ready")
+BSO_VIEW = MEMMAP.view("balls", "strikes", "outs", "half", "inning", "side")
+# F->P の立ち上がりを見てから読む確定値用。ゲートはもう確認済みなので読み直さない
+STATE_VIEW = MEMMAP.view(
+    "balls", "strikes", "outs", "half", "inning", "side",
+    "on1", "on2", "on3",
+    gated=False,
+)
+SCORE_VIEW = MEMMAP.view("home", "away")
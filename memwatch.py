@@ -0,0 +1,139 @@
+import re
+import time
+from collections import deque
+
+from memmap import WRAM_BASE, WRAM_SIZE
+from wramcap import tune_chunk
+
+# 複数の領域をまとめて読み続け、変化したバイトを探し、直近のフレームを覚えておく。
+# 「C0C3 が 1 増えたときに一緒に変わったバイトは？」のような問い合わせを、
+# エミュを読み直さずに手元の履歴だけで答える。
+
+REGIONS = ((WRAM_BASE, WRAM_SIZE),)   # (開始アドレス, バイト数) の並び
+HISTORY = 512                         # 覚えておくフレーム数（WRAM 全体で 8KB x 512 = 4MB）
+INTERVAL_SEC = 0.1
+
+_NONZERO = re.compile(rb"[^\x00]")
+
+
+class Frame:
+    """1回分の読み取り。data は全領域を順に連結したもの、changed は前のフレームから変わった位置。"""
+
+    __slots__ = ("seq", "ts", "data", "changed")
+
+    def __init__(self, seq, ts, data, changed):
+        self.seq = seq
+        self.ts = ts
+        self.data = data
+        self.changed = changed
+
+    def __repr__(self):
+        return f"<Frame {self.seq} changed={len(self.changed)}>"
+
+
+class MemWatcher:
+    """
+    w = MemWatcher(client, [(0xC000, 0x2000)])
+    for addr, old, new in w.poll(): ...
+    w.coincident(0xC0C3, lambda old, new: new == old + 1)
+    """
+
+    def __init__(self, client, regions=REGIONS, history=HISTORY, chunk=None):
+        self.client = client
+        self.regions = tuple(regions)
+        self.frames = deque(maxlen=history)
+        self.seq = 0
+
+        # 領域ごとの連結後の開始位置。読み取りは全領域ぶんの要求を1回の read_many で投げる
+        self.starts = []
+        pos = 0
+        for addr, size in self.regions:
+            self.starts.append(pos)
+            pos += size
+        self.size = pos
+
+        if chunk is None:
+            chunk = tune_chunk(client, self.regions[0][0])
+        self.reqs = []
+        for addr, size in self.regions:
+            for a in range(addr, addr + size, chunk):
+                self.reqs.append((a, min(chunk, addr + size - a)))
+
+    def addr_of(self, pos):
+        for (addr, size), start in zip(self.regions, self.starts):
+            if start <= pos < start + size:
+                return addr + (pos - start)
+        raise IndexError(pos)
+
+    def pos_of(self, addr):
+        for (base, size), start in zip(self.regions, self.starts):
+            if base <= addr < base + size:
+                return start + (addr - base)
+        raise KeyError(f"{addr:04X} is not watched")
+
+    def read(self):
+        """全領域を読む。読めなければ None（理由は client.last_error）。"""
+        blobs = self.client.read_many(self.reqs)
+        if None in blobs:
+            return None
+        return b"".join(blobs)
+
+    def failed_at(self):
+        # 直近の読み取りで失敗した要求のアドレスと理由
+        return [(a, self.client.last_error(a)) for a, _ in self.reqs if self.client.last_error(a)]
+
+    def push(self, data, ts=None):
+        """1フレーム追加して、前のフレームから変わった位置の一覧を返す。"""
+        prev = self.frames[-1].data if self.frames else None
+        if prev is None:
+            changed = []
+        else:
+            x = int.from_bytes(prev, "big") ^ int.from_bytes(data, "big")
+            changed = [m.start() for m in _NONZERO.finditer(x.to_bytes(self.size, "big"))] if x else []
+        self.seq += 1
+        self.frames.append(Frame(self.seq, time.time() if ts is None else ts, data, changed))
+        return changed
+
+    def poll(self):
+        """読んで履歴に積む。戻り値は [(addr, old, new)]（読めなければ None）。"""
+        prev = self.frames[-1].data if self.frames else None
+        data = self.read()
+        if data is None:
+            return None
+        changed = self.push(data)
+        return [(self.addr_of(p), prev[p], data[p]) for p in changed]
+
+    def transitions(self):
+        """履歴の隣り合うフレームの組 (前, 後) を古い順に。"""
+        fr = list(self.frames)
+        return list(zip(fr, fr[1:]))
+
+    def coincident(self, addr, cond=None):
+        """
+        addr が cond(old, new) を満たして変わった遷移（既定はどんな変化でも）で、一緒に変わったバイトを数える。
+        戻り値: (トリガ回数, [(addr, 一緒に変わった回数, 履歴全体で変わった回数)]) を
+        「一緒に変わった回数」の多い順、同数ならほかで変わっていない順に。
+        一緒に変わった回数 == トリガ回数 == 全体で変わった回数 なら「ちょうどそのときだけ変わる」バイト。
+        """
+        p = self.pos_of(addr)
+        trig = 0
+        together = {}
+        total = {}
+        for a, b in self.transitions():
+            for q in b.changed:
+                total[q] = total.get(q, 0) + 1
+            old, new = a.data[p], b.data[p]
+            if old == new or (cond is not None and not cond(old, new)):
+                continue
+            trig += 1
+            for q in b.changed:
+                if q != p:
+                    together[q] = together.get(q, 0) + 1
+        ranked = sorted(((self.addr_of(q), k, total[q]) for q, k in together.items()),
+                        key=lambda x: (-x[1], x[2], x[0]))
+        return trig, ranked
+
+    def history(self, addr):
+        """addr の値の履歴 [(seq, ts, 値)]。"""
+        p = self.pos_of(addr)
+        return [(f.seq, f.ts, f.data[p]) for f in self.frames]
@@ -1,11 +1,16 @@
 import json
-import socket
 import threading
 import time
-from collections import Counter
-from http.server import BaseHTTPRequestHandler, HTTPServer
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
 import os
 
+import eventlog
+import health
+from board import Board
+from gamestate import COMMIT, EVENT_HOST, EVENT_PORT, Event, EventServer, GameEngine
+from memclient import MemClient
+
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 OVERLAY_PATH = os.path.join(BASE_DIR, "overlay.html")
@@ -18,173 +23,232 @@ HOME_NAME = "HOME"
 AWAY_NAME = "AWAY"
 
 # ====== 読み取りタイミング ======
-COMMIT_DELAY_SEC = 0.20   # ズレるなら 0.25 まで上げる
 POLL_SEC = 0.02
-
-# ====== 投球可能ゲート ======
-ADDR_MODE1 = 0xC0D3  # P:00 / F:01
-ADDR_MODE2 = 0xC0CE  # P:14 / F:1A
-MODE1_PITCH = 0x00
-MODE2_PITCH = 0x14
-
-# ====== B/S/O/回 ======
-ADDR_BALL = 0xC0C0
-ADDR_STR  = 0xC0C2
-ADDR_OUT  = 0xC0C3
-ADDR_HALF = 0xC0C4
-
-# ====== 塁（投球可能タイミングで読む想定：0/非0）=====
-ADDR_1B = 0xD262
-ADDR_2B = 0xD282
-ADDR_3B = 0xD2A2
-
-# ====== スコア本体 ======
-ADDR_HOME = 0xD81F
-ADDR_AWAY = 0xD83F
-
-
-def read_u8(sock, addr):
-    cmd = f"READ_CORE_MEMORY {addr:04X} 1"
-    sock.sendto(cmd.encode("ascii"), (HOST, PORT))
-    data, _ = sock.recvfrom(4096)
-    text = data.decode("ascii", errors="replace").strip()
-    if " -1" in text:
-        return None
-    return int(text.split()[-1], 16)
-
-def stable_read_u8(sock, addr, n=9, gap=0.01):
-    c = Counter()
-    for _ in range(n):
-        v = read_u8(sock, addr)
-        if v is not None:
-            c[v] += 1
-        time.sleep(gap)
-    return c.most_common(1)[0][0] if c else None
-
-def half_to_inning_side(half):
-    inning = (half // 2) + 1
-    side = "表" if (half % 2) == 0 else "裏"
-    return inning, side
-
-def pitch_ready(sock):
-    m1 = read_u8(sock, ADDR_MODE1)
-    m2 = read_u8(sock, ADDR_MODE2)
-    return (m1 == MODE1_PITCH and m2 == MODE2_PITCH), m1, m2
-
-# 共有状態（HTTPから読む）
-STATE = {
-    "home_name": HOME_NAME,
-    "away_name": AWAY_NAME,
-    "home": 0,
-    "away": 0,
-    "inning": 1,
-    "side": "表",
-    "balls": 0,
-    "strikes": 0,
-    "outs": 0,
-    "on1": False,
-    "on2": False,
-    "on3": False,
-    "updated_at": None,
-    "mode1_hex": "--",
-    "mode2_hex": "--",
-}
-STATE_LOCK = threading.Lock()
+COMMIT_DELAY_SEC = 0.0    # 立ち上がりから確定読みまでの待ち（gatetrace.py の推奨値。0 なら即読む）
+COHERENT_READ = True      # 立ち上がり後の確定値を同じフレームの値として1回で読む
+SETTLE_K = 3              # COHERENT_READ が使えないとき: 何回続けて同じ値なら確定するか（ズレるなら増やす）
+SETTLE_MAX_SEC = 0.5      # 揃わないときの上限
+ADAPTIVE_POLL = True      # False なら常に POLL_SEC 間隔（/poll.json で様子を見られる）
+
+# /events（Server-Sent Events）で変化がないときに送る keepalive の間隔
+SSE_KEEPALIVE_SEC = 15
+SSE_RETRY_MS = 2000       # 切れたときにブラウザが再接続するまでの待ち
+
+# 他のスクリプトへのイベント配信（None なら配らない）
+EVENTS_ADDR = (EVENT_HOST, EVENT_PORT)
+
+# 確定値とゲートの変化を試合ごとのファイルに残す（eventlog.py。None なら残さない）
+EVENT_LOG_DIR = eventlog.LOG_DIR
+# 記録した試合を再生する（エミュは読まない）。例: "gamelogs/20251213_131359.evl"
+REPLAY_PATH = None
+REPLAY_SPEED = 1.0        # 2.0 で倍速。0 なら待たずに流す
+
+# 共有状態（HTTPから読む）。版の管理と作り置きの JSON は board.Board。
+# 更新スレッドは出来上がった版を差し替えるだけで、HTTP 側のロックを待たない
+BOARD = Board(HOME_NAME, AWAY_NAME)
+
+def replay_loop():
+    recs = eventlog.load(REPLAY_PATH)
+    print(f"replaying {REPLAY_PATH}: {len(recs)} records at x{REPLAY_SPEED}")
+
+    def show(r):
+        st = eventlog.to_state(r)
+        if r.kind == eventlog.K_COMMIT and all(
+                st[k] is not None for k in ("home", "away", "half", "balls", "strikes", "outs", "on1")):
+            BOARD.on_commit(Event(COMMIT, st, ts=r.ts))
+        BOARD.set_gate(st["mode1"], st["mode2"])
+
+    eventlog.replay(recs, show, REPLAY_SPEED)
+    print("replay finished")
+
+ENGINE = None
+UPDATER = health.UpdaterStatus()   # 更新スレッドの生存確認（/health・/metrics）
+UPDATER_RETRY_SEC = 1.0            # step が例外を出したら、これだけ待って続ける
 
 def updater_loop():
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.settimeout(0.5)
-
-    prev_ready = False
-    last_home = None
-    last_away = None
+    global ENGINE
+    if REPLAY_PATH:
+        replay_loop()
+        return
+    # ポーリングと F->P 検出は gamestate のエンジンに任せる
+    # （間隔は F の滞在時間から自動調整。最速が POLL_SEC）
+    engine = GameEngine(MemClient(HOST, PORT), poll_sec=POLL_SEC, adaptive=ADAPTIVE_POLL,
+                        settle_k=SETTLE_K, settle_max=SETTLE_MAX_SEC, coherent=COHERENT_READ,
+                        commit_delay=COMMIT_DELAY_SEC)
+    ENGINE = engine
+    engine.subscribe(BOARD.on_commit, [COMMIT])
+    if EVENT_LOG_DIR:
+        eventlog.EventLog(EVENT_LOG_DIR).attach(engine)
+
+    # 他のスクリプト（scoregetter.py など）へイベントを配る
+    if EVENTS_ADDR:
+        try:
+            EventServer(engine, *EVENTS_ADDR).start()
+        except OSError as e:
+            print(f"event server disabled: {e}")
 
     while True:
-        ready, m1, m2 = pitch_ready(sock)
-        with STATE_LOCK:
-            STATE["mode1_hex"] = f"{m1:02X}" if m1 is not None else "--"
-            STATE["mode2_hex"] = f"{m2:02X}" if m2 is not None else "--"
-
-        # F->P の立ち上がりでだけ確定値を読む
-        if (not prev_ready) and ready:
-            time.sleep(COMMIT_DELAY_SEC)
-
-            b = read_u8(sock, ADDR_BALL)
-            s = read_u8(sock, ADDR_STR)
-            o = read_u8(sock, ADDR_OUT)
-            h = read_u8(sock, ADDR_HALF)
-
-            r1 = read_u8(sock, ADDR_1B)
-            r2 = read_u8(sock, ADDR_2B)
-            r3 = read_u8(sock, ADDR_3B)
-
-            home_raw = stable_read_u8(sock, ADDR_HOME)
-            away_raw = stable_read_u8(sock, ADDR_AWAY)
-
-            if None not in (b, s, o, h, r1, r2, r3, home_raw, away_raw):
-                inning, side = half_to_inning_side(h)
-                on1 = (r1 != 0)
-                on2 = (r2 != 0)
-                on3 = (r3 != 0)
-
-                # スコア単調増加フィルタ（取りこぼし対策）
-                if last_home is None or home_raw >= last_home:
-                    last_home = home_raw
-                if last_away is None or away_raw >= last_away:
-                    last_away = away_raw
-
-                with STATE_LOCK:
-                    STATE["home_name"] = HOME_NAME
-                    STATE["away_name"] = AWAY_NAME
-                    STATE["home"] = int(last_home)
-                    STATE["away"] = int(last_away)
-                    STATE["inning"] = int(inning)
-                    STATE["side"] = side
-                    STATE["balls"] = int(b)
-                    STATE["strikes"] = int(s)
-                    STATE["outs"] = int(o)
-                    STATE["on1"] = bool(on1)
-                    STATE["on2"] = bool(on2)
-                    STATE["on3"] = bool(on3)
-                    STATE["updated_at"] = time.time()
-
-        prev_ready = ready
-        time.sleep(POLL_SEC)
+        try:
+            wait = engine.step()
+            BOARD.set_gate(engine.gate["mode1"], engine.gate["mode2"])
+            UPDATER.ok()
+        except Exception as e:
+            # 1回の失敗（ソケットのエラーなど）でスレッドを止めない。/health に残す
+            print(f"updater step failed: {e!r}")
+            UPDATER.error(e)
+            wait = UPDATER_RETRY_SEC
+        time.sleep(wait)
+
+# overlay.html は更新時刻が変わったときだけ読み直す
+HTML_CACHE = {"mtime": None, "body": None}
+HTML_LOCK = threading.Lock()
+
+def overlay_html():
+    mtime = os.stat(OVERLAY_PATH).st_mtime_ns
+    with HTML_LOCK:
+        if HTML_CACHE["mtime"] != mtime:
+            with open(OVERLAY_PATH, "rb") as f:
+                HTML_CACHE["body"] = f.read()
+            HTML_CACHE["mtime"] = mtime
+        return HTML_CACHE["body"]
 
 class Handler(BaseHTTPRequestHandler):
-    def _send(self, code, content_type, body: bytes):
+    def _send(self, code, content_type, body: bytes, headers=None):
         self.send_response(code)
         self.send_header("Content-Type", content_type)
-        self.send_header("Cache-Control", "no-store, no-cache, must-revalidate, max-age=0")
-        self.send_header("Pragma", "no-cache")
-        self.send_header("Expires", "0")
+        if headers and "ETag" in headers:
+            # ETag 付きは毎回問い合わせさせる（変わっていなければ 304）
+            self.send_header("Cache-Control", "no-cache")
+        else:
+            self.send_header("Cache-Control", "no-store, no-cache, must-revalidate, max-age=0")
+            self.send_header("Pragma", "no-cache")
+            self.send_header("Expires", "0")
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        if code != 304:
+            self.send_header("Content-Length", str(len(body)))
         self.end_headers()
         self.wfile.write(body)
 
+    def _stream_events(self, board):
+        # state が変わったときだけ1フレーム送る（つないだ直後は現在の値を1回送る）
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        version = None
+        try:
+            self.wfile.write(f"retry: {SSE_RETRY_MS}\n\n".encode("ascii"))
+            while True:
+                version, body = board.wait(version, SSE_KEEPALIVE_SEC)
+                if body is not None:
+                    frame = b"id: %d\ndata: %s\n\n" % (version, body)
+                else:
+                    frame = b": keepalive\n\n"
+                self.wfile.write(frame)
+                self.wfile.flush()
+        except OSError:
+            # ブラウザ側が閉じた
+            return
+
+    def _send_state(self, board):
+        # ?since=<版> なら変わった項目だけ（同じ版なら 304）
+        since = parse_qs(urlsplit(self.path).query).get("since")
+        if since:
+            body, tag = board.delta(since[0])
+            headers = {"ETag": f'"{tag}"'}
+            if body is None:
+                self._send(304, "application/json; charset=utf-8", b"", headers)
+                return
+            self._send(200, "application/json; charset=utf-8", body, headers)
+            return
+        # 作り置きの JSON を返すだけ。If-None-Match が一致すれば本文なしの 304
+        body, etag, version = board.snapshot()
+        headers = {"ETag": etag, "X-State-Version": str(version)}
+        if self.headers.get("If-None-Match") == etag:
+            self._send(304, "application/json; charset=utf-8", b"", headers)
+            return
+        self._send(200, "application/json; charset=utf-8", body, headers)
+
+    def _send_compact(self, board):
+        # 固定長のバイナリ（board.COMPACT）。ETag / 304 は state.json と同じ
+        body, etag, version = board.compact_snapshot()
+        headers = {"ETag": etag, "X-State-Version": str(version)}
+        if self.headers.get("If-None-Match") == etag:
+            self._send(304, "application/octet-stream", b"", headers)
+            return
+        self._send(200, "application/octet-stream", body, headers)
+
+    def _send_gate(self, board):
+        # ゲートの生の値（デバッグ表示用）。状態の版とは別で、毎回そのまま返す
+        self._send(200, "application/json; charset=utf-8", board.gate_body)
+
+    def _send_poll(self, engine):
+        # ポーリング間隔の調整用（現在のレートと取りこぼし候補の数、直近の確定読みの方式と時間）
+        sched = engine.scheduler if engine else None
+        stats = sched.stats() if sched else {}
+        stats["commit_read"] = engine.last_read if engine else None
+        body = json.dumps(stats, ensure_ascii=False).encode("utf-8")
+        self._send(200, "application/json; charset=utf-8", body)
+
+    def _send_health(self, checks):
+        # checks は {名前: health.check()}。down なら 503（監視から見て分かるように）
+        code, body = health.health_body(checks)
+        self._send(code, "application/json; charset=utf-8", body)
+
+    def _send_metrics(self, rows):
+        # Prometheus のテキスト形式（rows は health.prometheus() の引数）
+        self._send(200, "text/plain; version=0.0.4; charset=utf-8", health.prometheus(rows))
+
+    def _send_html(self):
+        # overlay.html を配る（同じフォルダに置いてある想定）
+        try:
+            self._send(200, "text/html; charset=utf-8", overlay_html())
+        except Exception as e:
+            self._send(500, "text/plain; charset=utf-8", f"overlay.html read error: {e}\npath={OVERLAY_PATH}".encode("utf-8"))
+
     def do_GET(self):
+        if self.path.startswith("/events"):
+            self._stream_events(BOARD)
+            return
+
+        if self.path.startswith("/poll.json"):
+            self._send_poll(ENGINE)
+            return
+
         if self.path.startswith("/state.json"):
-            with STATE_LOCK:
-                body = json.dumps(STATE, ensure_ascii=False).encode("utf-8")
-            self._send(200, "application/json; charset=utf-8", body)
+            self._send_state(BOARD)
             return
 
-        # overlay.html をそのまま配る（同じフォルダに置いてある想定）
-        if self.path == "/" or self.path.startswith("/overlay.html"):
-            try:
-                with open(OVERLAY_PATH, "rb") as f:
-                    body = f.read()
-                self._send(200, "text/html; charset=utf-8", body)
-            except Exception as e:
-                self._send(500, "text/plain; charset=utf-8", f"overlay.html read error: {e}\npath={OVERLAY_PATH}".encode("utf-8"))
+        if self.path.startswith("/state.bin"):
+            self._send_compact(BOARD)
             return
 
+        if self.path.startswith("/gate.json"):
+            self._send_gate(BOARD)
+            return
+
+        if self.path.startswith("/health"):
+            client = ENGINE.client if ENGINE else None
+            self._send_health({"": health.check(client, UPDATER if not REPLAY_PATH else None)})
+            return
+
+        if self.path.startswith("/metrics"):
+            client = ENGINE.client if ENGINE else None
+            self._send_metrics([({}, client, UPDATER if not REPLAY_PATH else None, ENGINE, BOARD)])
+            return
+
+        if self.path == "/" or self.path.startswith("/overlay.html"):
+            self._send_html()
+            return
 
         self._send(404, "text/plain; charset=utf-8", b"not found")
 
 def main():
     t = threading.Thread(target=updater_loop, daemon=True)
     t.start()
-    httpd = HTTPServer((HTTP_HOST, HTTP_PORT), Handler)
+    # /events は接続を開いたままにするので、リクエストごとにスレッドで受ける
+    httpd = ThreadingHTTPServer((HTTP_HOST, HTTP_PORT), Handler)
     print(f"Overlay server running: http://{HTTP_HOST}:{HTTP_PORT}/overlay.html")
     httpd.serve_forever()
 
@@ -0,0 +1,95 @@
+import time
+from collections import deque
+
+# ====== ポーリング間隔 ======
+FAST_SEC = 0.02     # 立ち上がりが近いとき（従来の POLL_SEC）
+SLOW_SEC = 0.15     # F に入った直後（まだ立ち上がらない）
+READY_SEC = 0.10    # P の間（立ち下がりを拾えれば十分）
+IDLE_SEC = 1.00     # エミュが応答しないとき
+IDLE_AFTER = 3      # 何回続けて読めなかったら IDLE にするか
+
+HISTORY = 32        # 覚えておく F の滞在時間の数
+EARLY_RATIO = 0.6   # 最短クラスの滞在時間のこの割合までは SLOW で待つ
+
+
+class PollScheduler:
+    """
+    ゲートの履歴から F->P の滞在時間を覚え、次のポーリングまでの間隔を決める。
+
+    - P の間は READY_SEC
+    - F に入った直後は SLOW_SEC、過去の短めの滞在時間に近づくほど FAST_SEC に寄せる
+    - 読めない状態が続いたら IDLE_SEC
+    missed_edges は、立ち上がりを FAST_SEC より粗い間隔で拾った回数（調整の目安）。
+    """
+
+    def __init__(self, fast=FAST_SEC, slow=SLOW_SEC, ready=READY_SEC, idle=IDLE_SEC):
+        self.fast = fast
+        self.slow = slow
+        self.ready_sec = ready
+        self.idle = idle
+
+        self.dwells = deque(maxlen=HISTORY)
+        self.f_since = None      # F に入った時刻（monotonic）
+        self.prev_ready = None
+        self.fail_streak = 0
+        self.interval = fast
+        self.edges = 0
+        self.missed_edges = 0
+
+    def _early_limit(self):
+        # 過去の滞在時間の短い方（下位 10% 程度）を基準にする
+        if not self.dwells:
+            return 0.0
+        ds = sorted(self.dwells)
+        return ds[len(ds) // 10] * EARLY_RATIO
+
+    def update(self, ready, ok=True, now=None):
+        """ポーリング結果を渡す。次のポーリングまでの秒数を返す。"""
+        now = time.monotonic() if now is None else now
+
+        if not ok:
+            self.fail_streak += 1
+            if self.fail_streak >= IDLE_AFTER:
+                self.interval = self.idle
+            return self.interval
+        self.fail_streak = 0
+
+        if ready and self.prev_ready is False:
+            # F->P の立ち上がり
+            self.edges += 1
+            if self.interval > self.fast * 1.5:
+                self.missed_edges += 1
+            if self.f_since is not None:
+                self.dwells.append(now - self.f_since)
+            self.f_since = None
+        elif not ready and self.prev_ready is not False:
+            # F に入った（起動直後に F だった場合も含む）
+            self.f_since = now
+        self.prev_ready = ready
+
+        if ready:
+            self.interval = self.ready_sec
+        else:
+            limit = self._early_limit()
+            elapsed = now - self.f_since
+            if limit <= 0 or elapsed >= limit:
+                self.interval = self.fast
+            else:
+                # limit に近づくほど fast へ（線形）
+                r = 1.0 - elapsed / limit
+                self.interval = self.fast + (self.slow - self.fast) * r
+                # limit を越えて寝過ごさない
+                self.interval = max(self.fast, min(self.interval, limit - elapsed))
+        return self.interval
+
+    def stats(self):
+        ds = sorted(self.dwells)
+        return {
+            "interval_sec": round(self.interval, 4),
+            "rate_hz": round(1.0 / self.interval, 2) if self.interval > 0 else None,
+            "edges": self.edges,
+            "missed_edges": self.missed_edges,
+            "dwell_min_sec": round(ds[0], 3) if ds else None,
+            "dwell_median_sec": round(ds[len(ds) // 2], 3) if ds else None,
+            "fail_streak": self.fail_streak,
+        }
@@ -0,0 +1,69 @@
+MAX_GAP = 0x20    # これ以下の隙間ならまとめて1回で読む
+MAX_LEN = 0x100   # 1回の READ_CORE_MEMORY で読む上限
+
+
+class ReadPlan:
+    """
+    名前付きアドレス群を、なるべく少ない READ_CORE_MEMORY にまとめた読み取り計画。
+
+    blocks: [(addr, nbytes), ...]  実際に送る要求
+    slots:  {name: (block_index, offset, width)}
+    """
+
+    def __init__(self, blocks, slots):
+        self.blocks = blocks
+        self.slots = slots
+
+    def __repr__(self):
+        b = " ".join(f"{a:04X}+{n:X}" for a, n in self.blocks)
+        return f"<ReadPlan {len(self.slots)} fields in {len(self.blocks)} reads: {b}>"
+
+    def read_raw(self, client):
+        return client.read_many(self.blocks)
+
+    def extract(self, blobs):
+        """read_raw の結果を名前ごとに切り出す。幅1は int、それ以外は bytes。読めなければ None。"""
+        out = {}
+        for name, (bi, off, width) in self.slots.items():
+            blob = blobs[bi]
+            if blob is None:
+                out[name] = None
+            elif width == 1:
+                out[name] = blob[off]
+            else:
+                out[name] = blob[off:off + width]
+        return out
+
+    def read(self, client):
+        return self.extract(self.read_raw(client))
+
+
+def plan_reads(fields, gap=MAX_GAP, max_len=MAX_LEN):
+    """
+    fields: {name: addr} または {name: (addr, width)}
+    隙間が gap 以下で、合計が max_len に収まるものを1ブロックにまとめる。
+    """
+    spans = []
+    for name, spec in fields.items():
+        addr, width = spec if isinstance(spec, tuple) else (spec, 1)
+        spans.append((addr, width, name))
+    spans.sort()
+
+    blocks = []   # [start, end)
+    members = []  # blockごとの [(name, addr, width)]
+    for addr, width, name in spans:
+        end = addr + width
+        if blocks:
+            start, cur_end = blocks[-1]
+            if addr - cur_end <= gap and max(end, cur_end) - start <= max_len:
+                blocks[-1][1] = max(end, cur_end)
+                members[-1].append((name, addr, width))
+                continue
+        blocks.append([addr, end])
+        members.append([(name, addr, width)])
+
+    slots = {}
+    for bi, (start, _) in enumerate(blocks):
+        for name, addr, width in members[bi]:
+            slots[name] = (bi, addr - start, width)
+    return ReadPlan([(s, e - s) for s, e in blocks], slots)
@@ -0,0 +1,338 @@
+import csv
+import json
+import os
+import re
+import struct
+import sys
+import time
+import zlib
+from datetime import datetime
+
+from memmap import STATE_VIEW, WRAM_SIZE
+from wramcap import mask_path
+
+# WRAM スナップショットを1つの追記専用ファイルにまとめて持つ。
+#
+#   ファイル先頭: MAGIC
+#   以降はレコードの繰り返し:
+#     REC ヘッダ（tag, ts, kind, ラベル長, データ長, マスク長）
+#     ラベル（JSON, UTF-8）
+#     データ（zlib。キーフレームは生の WRAM、差分フレームは直前のフレームとの XOR）
+#     マスク（zlib。wramcap の不安定バイトマスク。無ければ長さ 0）
+#
+# ラベルはヘッダのすぐ後ろにあるので、データを読み飛ばすだけで索引が作れる。
+
+MAGIC = b"FSNAPv1\n"
+REC = struct.Struct("<4sdBHII")
+REC_TAG = b"SNP1"
+
+KEY, DELTA = 0, 1
+KEYFRAME_EVERY = 32   # この枚数ごとにキーフレームを入れる（途中からの復元を短くする）
+ZLEVEL = 9
+
+DEFAULT_PATH = "score_snaps/archive.snap"
+
+
+def bases_mask(on1, on2, on3):
+    # 1塁=bit0, 2塁=bit1, 3塁=bit2
+    return (1 if on1 else 0) | (2 if on2 else 0) | (4 if on3 else 0)
+
+
+def state_labels(snap):
+    """スナップショット自体から読める状態（回・表裏・B/S/O・塁）をラベルにする。"""
+    st = STATE_VIEW.decode_wram(snap)
+    return {
+        "inning": st["inning"],
+        "side": st["side"],
+        "balls": st["balls"],
+        "strikes": st["strikes"],
+        "outs": st["outs"],
+        "bases": bases_mask(st["on1"], st["on2"], st["on3"]),
+    }
+
+
+def _xor(a, b):
+    n = len(a)
+    return (int.from_bytes(a, "big") ^ int.from_bytes(b, "big")).to_bytes(n, "big")
+
+
+class Entry:
+    """索引の1件。i はアーカイブ内の通し番号、key はこのフレームの復元に使うキーフレームの番号。"""
+
+    __slots__ = ("i", "ts", "kind", "labels", "key", "data_at", "data_len", "mask_len")
+
+    def __init__(self, i, ts, kind, labels, key, data_at, data_len, mask_len):
+        self.i = i
+        self.ts = ts
+        self.kind = kind
+        self.labels = labels
+        self.key = key
+        self.data_at = data_at
+        self.data_len = data_len
+        self.mask_len = mask_len
+
+    def __repr__(self):
+        t = datetime.fromtimestamp(self.ts).strftime("%Y%m%d_%H%M%S")
+        return f"<Entry {self.i} {t} {'K' if self.kind == KEY else 'D'} {self.labels}>"
+
+    def match(self, **labels):
+        return all(self.labels.get(k) == v for k, v in labels.items())
+
+
+class SnapStore:
+    """
+    追記専用のスナップショットアーカイブ。
+
+    store = SnapStore("score_snaps/archive.snap")
+    store.append(snap, {"home": 1, "away": 0}, mask=mask)
+    for e, snap in store.frames(store.select(home=1)): ...
+    """
+
+    def __init__(self, path=DEFAULT_PATH, keyframe_every=KEYFRAME_EVERY):
+        self.path = path
+        self.keyframe_every = keyframe_every
+        self.entries = []
+        self._last = None     # 最後に追記したフレーム（次の差分の基準）
+        self._cache = None    # (i, bytes) 直前に復元したフレーム
+        if os.path.exists(path):
+            self._scan()
+        else:
+            d = os.path.dirname(path)
+            if d:
+                os.makedirs(d, exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(MAGIC)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _scan(self):
+        with open(self.path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"not a snapshot archive: {self.path}")
+            good = f.tell()
+            key = None
+            while True:
+                head = f.read(REC.size)
+                if len(head) < REC.size:
+                    break
+                tag, ts, kind, llen, dlen, mlen = REC.unpack(head)
+                if tag != REC_TAG:
+                    break
+                raw = f.read(llen)
+                data_at = f.tell()
+                f.seek(dlen + mlen, os.SEEK_CUR)
+                if len(raw) < llen or f.tell() > os.fstat(f.fileno()).st_size:
+                    break
+                i = len(self.entries)
+                if kind == KEY:
+                    key = i
+                self.entries.append(Entry(i, ts, kind, json.loads(raw), key, data_at, dlen, mlen))
+                good = f.tell()
+        # 書き込み途中で落ちた末尾は捨てる
+        if good < os.path.getsize(self.path):
+            with open(self.path, "r+b") as f:
+                f.truncate(good)
+
+    def get(self, i):
+        """i 番目のフレームを復元する（直前のキーフレームから差分を当てていく）。"""
+        e = self.entries[i]
+        start, cur = e.key, None
+        if self._cache and e.key <= self._cache[0] <= i:
+            start, cur = self._cache[0] + 1, self._cache[1]
+        with open(self.path, "rb") as f:
+            for j in range(start, i + 1):
+                ej = self.entries[j]
+                f.seek(ej.data_at)
+                data = zlib.decompress(f.read(ej.data_len))
+                cur = data if ej.kind == KEY else _xor(cur, data)
+        self._cache = (i, cur)
+        return cur
+
+    def mask(self, i):
+        """i 番目の不安定バイトマスク。保存していなければ None。"""
+        e = self.entries[i]
+        if not e.mask_len:
+            return None
+        with open(self.path, "rb") as f:
+            f.seek(e.data_at + e.data_len)
+            return zlib.decompress(f.read(e.mask_len))
+
+    def append(self, snap, labels, ts=None, mask=None):
+        """1フレーム追記する。戻り値はその Entry。"""
+        ts = time.time() if ts is None else ts
+        i = len(self.entries)
+        if self._last is None and self.entries:
+            self._last = self.get(i - 1)
+
+        kind = KEY
+        data = zlib.compress(snap, ZLEVEL)
+        if (self._last is not None and len(self._last) == len(snap)
+                and i - self.entries[-1].key < self.keyframe_every):
+            delta = zlib.compress(_xor(self._last, snap), ZLEVEL)
+            if len(delta) < len(data):
+                kind, data = DELTA, delta
+        raw = json.dumps(labels, ensure_ascii=False).encode("utf-8")
+        mdata = zlib.compress(mask, ZLEVEL) if mask is not None else b""
+
+        with open(self.path, "ab") as f:
+            f.write(REC.pack(REC_TAG, ts, kind, len(raw), len(data), len(mdata)))
+            f.write(raw)
+            data_at = f.tell()
+            f.write(data)
+            f.write(mdata)
+
+        key = i if kind == KEY else self.entries[-1].key
+        e = Entry(i, ts, kind, labels, key, data_at, len(data), len(mdata))
+        self.entries.append(e)
+        self._last = bytes(snap)
+        self._cache = (i, self._last)
+        return e
+
+    def select(self, fn=None, since=None, until=None, **labels):
+        """ラベル（完全一致）・時刻範囲・任意の条件 fn(entry) で絞り込む。"""
+        out = []
+        for e in self.entries:
+            if since is not None and e.ts < since:
+                continue
+            if until is not None and e.ts >= until:
+                continue
+            if labels and not e.match(**labels):
+                continue
+            if fn is not None and not fn(e):
+                continue
+            out.append(e)
+        return out
+
+    def frames(self, entries=None):
+        """(entry, snap) を順に返す。番号順に並べておくと差分を使い回せて速い。"""
+        for e in (self.entries if entries is None else entries):
+            yield e, self.get(e.i)
+
+
+# ====== 既存のばらばらの .bin からの取り込み ======
+
+SCORE_NAME = re.compile(r"(\d{8}_\d{6})_H(\d+)_A(\d+)\.bin$")
+OLD_NAME = re.compile(r"(\d{8}_\d{6})_trig([0-9A-Fa-f]{2})_i(\d+)(表|裏)_b(\d+)s(\d+)o(\d+)_bases(\w+)\.bin$")
+
+
+def _ts(stamp):
+    return datetime.strptime(stamp, "%Y%m%d_%H%M%S").timestamp()
+
+
+def _read_notes(folder):
+    # score_snaps/meta.csv の note 列（あれば）
+    notes = {}
+    path = os.path.join(folder, "meta.csv")
+    if os.path.exists(path):
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                notes[os.path.basename(row["file"])] = row.get("note", "")
+    return notes
+
+
+def labels_from_file(path, notes=None):
+    """ファイル名（と meta.csv）からラベルと時刻を作る。分からない形式なら None。"""
+    name = os.path.basename(path)
+    m = SCORE_NAME.search(name)
+    if m:
+        with open(path, "rb") as f:
+            snap = f.read()
+        labels = {"home": int(m.group(2)), "away": int(m.group(3))}
+        labels.update(state_labels(snap))
+        labels["note"] = (notes or {}).get(name, "")
+        labels["file"] = name
+        return _ts(m.group(1)), labels, snap
+    m = OLD_NAME.search(name)
+    if m:
+        with open(path, "rb") as f:
+            snap = f.read()
+        bases = m.group(8)
+        labels = {
+            "inning": int(m.group(3)),
+            "side": m.group(4),
+            "balls": int(m.group(5)),
+            "strikes": int(m.group(6)),
+            "outs": int(m.group(7)),
+            # 1B2B3B の順で手入力したもの。skip / --- は未入力
+            "bases": bases_mask(*(c == "1" for c in bases)) if re.fullmatch(r"[01]{3}", bases) else None,
+            "trig": m.group(2).upper(),
+            "file": name,
+        }
+        return _ts(m.group(1)), labels, snap
+    return None
+
+
+def import_files(store, paths):
+    """.bin（またはそれを含むフォルダ）を時刻順に取り込む。取り込んだ件数を返す。"""
+    files = []
+    for p in paths:
+        if os.path.isdir(p):
+            files += [os.path.join(p, n) for n in os.listdir(p) if n.endswith(".bin")]
+        else:
+            files.append(p)
+
+    have = {e.labels.get("file") for e in store.entries}
+    rows = []
+    notes_by_dir = {}
+    for path in files:
+        d = os.path.dirname(path)
+        if d not in notes_by_dir:
+            notes_by_dir[d] = _read_notes(d)
+        got = labels_from_file(path, notes_by_dir[d])
+        if got is None:
+            print(f"skip (unknown name): {path}")
+            continue
+        ts, labels, snap = got
+        if labels["file"] in have:
+            continue
+        if len(snap) != WRAM_SIZE:
+            print(f"skip (size {len(snap)}): {path}")
+            continue
+        mp = mask_path(path)
+        mask = open(mp, "rb").read() if os.path.exists(mp) else None
+        rows.append((ts, labels, snap, mask))
+
+    rows.sort(key=lambda r: r[0])
+    for ts, labels, snap, mask in rows:
+        store.append(snap, labels, ts=ts, mask=mask)
+    return len(rows)
+
+
+def main(argv):
+    usage = (
+        "usage:\n"
+        "  python snapstore.py import ARCHIVE FILE_OR_DIR...   .bin を取り込む\n"
+        "  python snapstore.py list ARCHIVE [key=value ...]     索引を表示（ラベルで絞り込み）\n"
+        "  python snapstore.py export ARCHIVE INDEX OUT.bin     1枚を .bin に書き出す\n"
+    )
+    if len(argv) < 3:
+        print(usage)
+        return 2
+    cmd, path = argv[1], argv[2]
+    if cmd == "import":
+        store = SnapStore(path)
+        n = import_files(store, argv[3:])
+        print(f"imported {n} snapshots -> {path} ({len(store)} total, {os.path.getsize(path)} bytes; "
+              f"{n * WRAM_SIZE} bytes as loose files)")
+    elif cmd == "list":
+        store = SnapStore(path)
+        labels = {}
+        for kv in argv[3:]:
+            k, v = kv.split("=", 1)
+            labels[k] = int(v) if v.lstrip("-").isdigit() else v
+        for e in store.select(**labels):
+            print(e)
+    elif cmd == "export":
+        store = SnapStore(path)
+        with open(argv[4], "wb") as f:
+            f.write(store.get(int(argv[3])))
+        print(f"saved: {argv[4]}")
+    else:
+        print(usage)
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
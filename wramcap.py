@@ -0,0 +1,101 @@
+import os
+import re
+import time
+
+from memmap import WRAM_BASE, WRAM_SIZE
+
+# ====== キャプチャ設定 ======
+CHUNK = None    # 1回の READ_CORE_MEMORY の長さ。None なら tune_chunk() で自動
+CHUNK_SIZES = (0x2000, 0x1000, 0x0800, 0x0400, 0x0200, 0x0100)   # 大きい順に試す
+CAP_READS = 3   # 重ければ 1 でもOK（まずは収集優先）
+CAP_GAP = 0.01
+
+MASK_SUFFIX = ".mask"   # 不安定バイトのマスク（スナップショットと同じ名前で並べる）
+
+_NONZERO = re.compile(rb"[^\x00]")
+
+
+_tuned = {}   # client.addr -> chunk
+
+
+def tune_chunk(client, base=WRAM_BASE, sizes=CHUNK_SIZES):
+    """
+    RetroArch が1回で返してくれる最大の長さを探す（大きい順に試して最初に全部返ってきたもの）。
+    結果は接続先ごとに覚えておく。
+    """
+    if client.addr in _tuned:
+        return _tuned[client.addr]
+    for n in sizes:
+        if client.read_block(base, n) is not None:
+            _tuned[client.addr] = n
+            return n
+    raise RuntimeError(f"read failed at {base:04X}: {client.last_error(base)}")
+
+
+def dump_wram(client, base=WRAM_BASE, size=WRAM_SIZE, chunk=CHUNK):
+    """
+    base から size バイトを chunk ごとの要求に分け、まとめて投げて（MemClient の WINDOW 個ずつ並行）
+    アドレスで組み立て直す。
+    """
+    if chunk is None:
+        chunk = tune_chunk(client, base)
+    reqs = [(a, min(chunk, base + size - a)) for a in range(base, base + size, chunk)]
+    blobs = client.read_many(reqs)
+    for (a, n), blob in zip(reqs, blobs):
+        if blob is None:
+            raise RuntimeError(f"read failed at {a:04X} len={n}: {client.last_error(a)}")
+    return b"".join(blobs)
+
+
+def vote(matrix, n, size=WRAM_SIZE):
+    """
+    matrix: n 回分のダンプを連結した bytes（n * size）
+    戻り値: (オフセットごとの最頻値, 不安定マスク)
+    マスクは読みごとに値が揃わなかったオフセットが 1、ほかは 0。
+
+    全ダンプが一致するオフセットは先頭ダンプの値をそのまま使う。
+    一致しないオフセットは巨大整数の XOR で探し、その列だけ多数決する
+    （同数なら先に読んだ値。Counter.most_common と同じ）。
+    """
+    mv = memoryview(matrix)
+    first = int.from_bytes(mv[:size], "big")
+    diff = 0
+    for i in range(1, n):
+        diff |= first ^ int.from_bytes(mv[i * size:(i + 1) * size], "big")
+
+    out = bytearray(mv[:size])
+    mask = bytearray(size)
+    if diff:
+        for m in _NONZERO.finditer(diff.to_bytes(size, "big")):
+            off = m.start()
+            col = matrix[off::size]
+            out[off] = max(col, key=col.count)
+            mask[off] = 1
+    return bytes(out), bytes(mask)
+
+
+def capture(client, reads=CAP_READS, gap=CAP_GAP, dump=dump_wram):
+    """reads 回ダンプして多数決する。戻り値は vote() と同じ (snap, mask)。"""
+    matrix = bytearray()
+    for i in range(reads):
+        matrix += dump(client)
+        if i + 1 < reads:
+            time.sleep(gap)
+    return vote(matrix, reads, len(matrix) // reads)
+
+
+def unstable_offsets(mask, base=WRAM_BASE):
+    """マスクで 1 になっているアドレスの一覧。"""
+    return [base + m.start() for m in _NONZERO.finditer(mask)]
+
+
+def mask_path(snap_path):
+    root, _ = os.path.splitext(snap_path)
+    return root + MASK_SUFFIX
+
+
+def save_capture(path, snap, mask):
+    with open(path, "wb") as f:
+        f.write(snap)
+    with open(mask_path(path), "wb") as f:
+        f.write(mask)